@@ -1,20 +1,31 @@
+import contextlib
 import uuid
+from types import SimpleNamespace
 
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from sqlmodel import Session, col, func, select
 from transcribee_backend.auth import generate_share_token
 from transcribee_backend.config import settings
+from transcribee_backend.db import get_redis_task_channel, get_task_ready_notifier
+from transcribee_backend.helpers.compaction import compact_document
+from transcribee_backend.helpers.sync import DocumentSyncManager, DocumentUpdateWriter
+from transcribee_backend.helpers.time import now_tz_aware
 from transcribee_backend.models import (
     Document,
     DocumentMediaFile,
     DocumentMediaTag,
     DocumentShareToken,
+    DocumentSnapshot,
     DocumentUpdate,
     Task,
     TaskAttempt,
     TaskDependency,
 )
+from transcribee_backend.util.export_cache import ExportCache
+from transcribee_backend.util.redis_task_channel import RedisTaskChannel
+from transcribee_proto.api import ExportFormat, ExportTaskParameters, TaskType
 
 
 @pytest.fixture
@@ -49,6 +60,7 @@ def test_doc_delete(
         DocumentMediaTag,
         DocumentUpdate,
         DocumentShareToken,
+        DocumentSnapshot,
     ]
     counts = {}
     for table in checked_tables:
@@ -69,6 +81,9 @@ def test_doc_delete(
     assert req.status_code == 200
     assert len(req.json()) >= 1
 
+    memory_session.add(DocumentUpdate(document_id=document_id, change_bytes=b""))
+    memory_session.commit()
+    compact_document(memory_session, document_id)
     memory_session.add(DocumentUpdate(document_id=document_id, change_bytes=b""))
     memory_session.add(TaskAttempt(task_id=task_id, attempt_number=1))
     memory_session.add(
@@ -178,3 +193,308 @@ def test_doc_share(
         k: v for k, v in req.json().items() if k not in ["has_full_access", "can_write"]
     }
     assert req_json_without_auth == ref_req_json_without_auth
+
+
+def test_doc_compaction(
+    memory_session: Session, document_id: uuid.UUID, monkeypatch: pytest.MonkeyPatch
+):
+    # the changes are no real automerge changes, so the saved document is their bytes
+    # in sorted order
+    loaded = []
+
+    def load(data: bytes):
+        loaded.append(data)
+        return data
+
+    monkeypatch.setattr("transcribee_backend.helpers.compaction.automerge.load", load)
+    monkeypatch.setattr(
+        "transcribee_backend.helpers.compaction.automerge.save",
+        lambda doc: bytes(sorted(doc)),
+    )
+
+    for change in [b"a", b"b"]:
+        memory_session.add(DocumentUpdate(document_id=document_id, change_bytes=change))
+    memory_session.commit()
+
+    assert compact_document(memory_session, document_id) == 3
+    assert compact_document(memory_session, document_id) == 0
+
+    memory_session.add(DocumentUpdate(document_id=document_id, change_bytes=b"c"))
+    memory_session.commit()
+    assert compact_document(memory_session, document_id) == 1
+
+    snapshot = memory_session.exec(
+        select(DocumentSnapshot).where(DocumentSnapshot.document_id == document_id)
+    ).one()
+    assert snapshot.change_count == 4
+    # the previous snapshot is loaded together with the new changes
+    assert loaded[-1] == b"abc"
+    assert snapshot.snapshot_bytes == b"abc"
+
+    remaining_updates = memory_session.exec(
+        select(DocumentUpdate).where(DocumentUpdate.document_id == document_id)
+    ).all()
+    assert remaining_updates == []
+
+
+@pytest.mark.anyio
+async def test_doc_update_writer(memory_session: Session, document_id: uuid.UUID):
+    writer = DocumentUpdateWriter(batch_size=100, max_pending=1000)
+    changed_at = memory_session.get_one(Document, document_id).changed_at
+
+    await writer.add(document_id, b"a")
+    await writer.add(document_id, b"b")
+    assert writer.pending_changes(document_id) == [b"a", b"b"]
+
+    writer.write_pending(memory_session)
+    assert writer.pending_changes(document_id) == []
+
+    changes = memory_session.exec(
+        select(DocumentUpdate.change_bytes).where(
+            DocumentUpdate.document_id == document_id
+        )
+    ).all()
+    assert sorted(changes) == [b"", b"a", b"b"]
+
+    memory_session.expire_all()
+    assert memory_session.get_one(Document, document_id).changed_at > changed_at
+
+
+@pytest.mark.anyio
+async def test_doc_update_writer_failing_document(
+    memory_session: Session, logged_in_client: TestClient, document_id: uuid.UUID
+):
+    req = logged_in_client.post(
+        "/api/v1/documents/",
+        files={"file": b""},
+        data={"name": "failing document", "model": "tiny", "language": "auto"},
+    )
+    assert req.status_code == 200
+    failing_document_id = uuid.UUID(req.json()["id"])
+    deleted_document_id = uuid.uuid4()
+
+    class FailingWriter(DocumentUpdateWriter):
+        def _write(self, session, pending):
+            if failing_document_id in pending or deleted_document_id in pending:
+                raise ValueError("insert failed")
+            super()._write(session, pending)
+
+    writer = FailingWriter(batch_size=100, max_pending=3, max_attempts=2)
+    await writer.add(document_id, b"a")
+    await writer.add(failing_document_id, b"b")
+    await writer.add(deleted_document_id, b"c")
+    # the buffer is full
+    await writer.add(document_id, b"d")
+
+    # the other documents do not prevent writing the changes of `document_id`
+    writer.write_pending(memory_session)
+    changes = memory_session.exec(
+        select(DocumentUpdate.change_bytes).where(
+            DocumentUpdate.document_id == document_id
+        )
+    ).all()
+    assert sorted(changes) == [b"", b"a"]
+
+    # changes of deleted documents are dropped, others are retried
+    assert writer.pending_changes(deleted_document_id) == []
+    assert writer.pending_changes(failing_document_id) == [b"b"]
+
+    await writer.add(document_id, b"e")
+    writer.write_pending(memory_session)
+    assert writer.pending_changes(failing_document_id) == []
+
+
+@pytest.mark.anyio
+async def test_doc_update_writer_publishes_written_changes(
+    memory_session: Session, document_id: uuid.UUID, monkeypatch: pytest.MonkeyPatch
+):
+    published = []
+
+    class RecordingSyncManager(DocumentSyncManager):
+        async def publish_written(self, changes):
+            published.append(changes)
+
+    monkeypatch.setattr(
+        "transcribee_backend.helpers.sync.SessionContextManager",
+        lambda path: contextlib.nullcontext(memory_session),
+    )
+    monkeypatch.setattr(
+        "transcribee_backend.helpers.sync.sync_manager", RecordingSyncManager()
+    )
+
+    failing_document_id = uuid.uuid4()
+
+    class FailingWriter(DocumentUpdateWriter):
+        def _write(self, session, pending):
+            if failing_document_id in pending:
+                raise ValueError("insert failed")
+            super()._write(session, pending)
+
+    writer = FailingWriter(batch_size=2, max_pending=1000)
+    await writer.add(document_id, b"a")
+    await writer.add(failing_document_id, b"b")
+    # changes are only published after they are written, in batches
+    assert published == [{document_id: [b"a"]}]
+
+
+def test_doc_export(
+    memory_session: Session, logged_in_client: TestClient, document_id: uuid.UUID
+):
+    # the document has no content yet, so it is exported without any cues. The export
+    # is rendered by the backend, no worker is involved
+    for format in ["VTT", "SRT"]:
+        req = logged_in_client.get(
+            f"/api/v1/documents/{document_id}/export/",
+            params={
+                "format": format,
+                "include_speaker_names": True,
+                "include_word_timing": False,
+            },
+        )
+        assert req.status_code == 200
+        assert req.text.startswith("WEBVTT") == (format == "VTT")
+    export_tasks = memory_session.exec(
+        select(Task).where(Task.task_type == TaskType.EXPORT)
+    ).all()
+    assert export_tasks == []
+
+
+def test_doc_export_cached_until_changed(
+    memory_session: Session,
+    logged_in_client: TestClient,
+    document_id: uuid.UUID,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    rendered = []
+
+    def render_export(doc, params):
+        rendered.append(doc)
+        return "WEBVTT"
+
+    monkeypatch.setattr(
+        "transcribee_backend.routers.document.render_export", render_export
+    )
+
+    def export():
+        req = logged_in_client.get(
+            f"/api/v1/documents/{document_id}/export/",
+            params={
+                "format": "VTT",
+                "include_speaker_names": True,
+                "include_word_timing": False,
+            },
+        )
+        assert req.status_code == 200
+
+    export()
+    export()
+    assert len(rendered) == 1
+
+    # changes written by any process update the revision stored in the database
+    document = memory_session.get_one(Document, document_id)
+    document.changed_at = now_tz_aware()
+    memory_session.add(document)
+    memory_session.commit()
+    export()
+    assert len(rendered) == 2
+
+
+class NoResultRedis:
+    async def blpop(self, keys, timeout):
+        return None
+
+
+def test_doc_export_worker_timeout(
+    memory_session: Session,
+    logged_in_client: TestClient,
+    app_with_memory_session: FastAPI,
+    document_id: uuid.UUID,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(settings, "export_backend", "worker")
+    app_with_memory_session.dependency_overrides[get_redis_task_channel] = lambda: (
+        RedisTaskChannel(NoResultRedis())
+    )
+    try:
+        req = logged_in_client.get(
+            f"/api/v1/documents/{document_id}/export/",
+            params={
+                "format": "VTT",
+                "include_speaker_names": True,
+                "include_word_timing": False,
+            },
+        )
+    finally:
+        del app_with_memory_session.dependency_overrides[get_redis_task_channel]
+    assert req.status_code == 504
+
+    # the export task nobody waits for anymore is cancelled
+    export_tasks = memory_session.exec(
+        select(Task).where(Task.task_type == TaskType.EXPORT)
+    ).all()
+    assert export_tasks == []
+
+
+def test_doc_export_worker_channel_full(
+    memory_session: Session,
+    logged_in_client: TestClient,
+    app_with_memory_session: FastAPI,
+    document_id: uuid.UUID,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(settings, "export_backend", "worker")
+    notified = []
+    overrides = {
+        get_redis_task_channel: lambda: RedisTaskChannel(NoResultRedis(), max_waits=0),
+        get_task_ready_notifier: lambda: SimpleNamespace(
+            notify=lambda: notified.append(True)
+        ),
+    }
+    app_with_memory_session.dependency_overrides.update(overrides)
+    try:
+        req = logged_in_client.get(
+            f"/api/v1/documents/{document_id}/export/",
+            params={
+                "format": "VTT",
+                "include_speaker_names": True,
+                "include_word_timing": False,
+            },
+        )
+    finally:
+        for dependency in overrides:
+            del app_with_memory_session.dependency_overrides[dependency]
+    assert req.status_code == 503
+
+    # rejected exports never create a task
+    assert notified == []
+    export_tasks = memory_session.exec(
+        select(Task).where(Task.task_type == TaskType.EXPORT)
+    ).all()
+    assert export_tasks == []
+
+
+@pytest.mark.anyio
+async def test_export_cache():
+    cache = ExportCache(max_entries=2, ttl=60)
+    document_id = uuid.uuid4()
+    params = ExportTaskParameters(
+        format=ExportFormat.VTT, include_speaker_names=True, include_word_timing=False
+    )
+    srt_params = params.model_copy(update={"format": ExportFormat.SRT})
+
+    revision = "2024-01-01T00:00:00+00:00"
+    assert await cache.get(document_id, revision, params) is None
+    await cache.put(document_id, revision, params, "vtt")
+    await cache.put(document_id, revision, srt_params, "srt")
+    assert await cache.get(document_id, revision, params) == "vtt"
+    assert await cache.get(document_id, revision, srt_params) == "srt"
+
+    # exports of older revisions are not used for new changes of the document
+    new_revision = "2024-01-01T00:00:01+00:00"
+    assert await cache.get(document_id, new_revision, params) is None
+
+    # the least recently used export is evicted
+    other_document_id = uuid.uuid4()
+    await cache.put(other_document_id, revision, params, "other")
+    assert await cache.get(document_id, revision, params) is None
+    assert await cache.get(document_id, revision, srt_params) == "srt"
@@ -1,8 +1,13 @@
+import datetime
 import timeit
 from typing import Callable
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlmodel import Session
+from transcribee_backend.auth import generate_user_token
+from transcribee_backend.helpers.time import now_tz_aware
+from transcribee_backend.models import User
 
 
 def create_doc(logged_in_client: TestClient):
@@ -46,3 +51,24 @@ def test_execution_speed(
         lambda: test_function(logged_in_client=logged_in_client), number=N
     )
     assert time / N <= max_time
+
+
+@pytest.mark.parametrize("sessions,N,max_time", [(2000, 50, 0.02)])
+def test_token_validation_speed(
+    logged_in_client: TestClient,
+    memory_session: Session,
+    user: User,
+    sessions: int,
+    N: int,
+    max_time: float,
+):
+    # other sessions of the same user must not slow down token validation
+    for _ in range(sessions):
+        _, db_token = generate_user_token(
+            user, valid_until=now_tz_aware() + datetime.timedelta(days=1)
+        )
+        memory_session.add(db_token)
+    memory_session.commit()
+
+    time = timeit.timeit(lambda: user_me(logged_in_client=logged_in_client), number=N)
+    assert time / N <= max_time
@@ -0,0 +1,100 @@
+import time
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from transcribee_backend.auth import create_worker
+from transcribee_backend.config import settings
+from transcribee_backend.models import Task, TaskType
+from transcribee_backend.models.task import TaskState
+from transcribee_backend.routers.task import get_ready_task
+
+
+@pytest.fixture
+def document_id(logged_in_client: TestClient):
+    req = logged_in_client.post(
+        "/api/v1/documents/",
+        files={"file": b""},
+        data={"name": "test document", "model": "tiny", "language": "auto"},
+    )
+    assert req.status_code == 200
+    return uuid.UUID(req.json()["id"])
+
+
+@pytest.fixture
+def worker_client(memory_session: Session, app_with_memory_session: FastAPI):
+    worker = create_worker(memory_session, name="test worker")
+    return TestClient(
+        app_with_memory_session, headers={"Authorization": f"Worker {worker.token}"}
+    )
+
+
+def test_get_ready_task_respects_dependencies(
+    memory_session: Session, document_id: uuid.UUID
+):
+    assert get_ready_task(memory_session, [TaskType.TRANSCRIBE]) is None
+
+    task = get_ready_task(memory_session, [TaskType.REENCODE, TaskType.TRANSCRIBE])
+    assert task is not None
+    assert task.task_type == TaskType.REENCODE
+
+    task.state = TaskState.COMPLETED
+    memory_session.add(task)
+    memory_session.commit()
+
+    task = get_ready_task(memory_session, [TaskType.REENCODE, TaskType.TRANSCRIBE])
+    assert task is not None
+    assert task.task_type == TaskType.TRANSCRIBE
+    assert task.document_id == document_id
+
+
+def test_get_ready_task_ignores_finished_tasks(
+    memory_session: Session, document_id: uuid.UUID
+):
+    memory_session.add(
+        Task(
+            task_type=TaskType.EXPORT,
+            task_parameters={},
+            document_id=document_id,
+            state=TaskState.FAILED,
+        )
+    )
+    memory_session.commit()
+
+    assert get_ready_task(memory_session, [TaskType.EXPORT]) is None
+
+
+def test_claim_unassigned_task(worker_client: TestClient, document_id: uuid.UUID):
+    req = worker_client.post(
+        "/api/v1/tasks/claim_unassigned_task/",
+        params={"task_type": [TaskType.REENCODE.value], "wait": 1},
+    )
+    assert req.status_code == 200
+    assert req.json()["task_type"] == TaskType.REENCODE.value
+    assert req.json()["document"]["id"] == str(document_id)
+
+    start = time.monotonic()
+    req = worker_client.post(
+        "/api/v1/tasks/claim_unassigned_task/",
+        params={"task_type": [TaskType.REENCODE.value], "wait": 0.2},
+    )
+    assert req.status_code == 200
+    assert req.json() is None
+    assert time.monotonic() - start >= 0.2
+
+
+def test_claim_unassigned_task_caps_wait(
+    worker_client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    # waits longer than the configured maximum are shortened instead of rejected
+    monkeypatch.setattr(settings, "task_claim_max_wait", 0.2)
+    start = time.monotonic()
+    req = worker_client.post(
+        "/api/v1/tasks/claim_unassigned_task/",
+        params={"task_type": [TaskType.REENCODE.value], "wait": 30},
+    )
+    assert req.status_code == 200
+    assert req.json() is None
+    assert time.monotonic() - start < 5
@@ -1,6 +1,7 @@
 import argparse
 
 from .command import Command
+from .commands.compact_documents import CompactDocumentsCmd
 from .commands.create_api_token import CreateApiTokenCmd
 from .commands.create_user import CreateUserCmd
 from .commands.create_user_token import CreateUserTokenCmd
@@ -29,6 +30,11 @@ add_command("reset_task", "Reset a task", ResetTaskCmd())
 add_command("set_password", "Set the password of a user", SetPasswordCmd())
 add_command("set_document", "Set the document contents of a document", SetDocumentCmd())
 add_command("list_documents", "List all documents", ListDocumentsCmd())
+add_command(
+    "compact_documents",
+    "Fold the change log of documents into their snapshots",
+    CompactDocumentsCmd(),
+)
 
 
 def main():
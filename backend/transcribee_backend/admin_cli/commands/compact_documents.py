@@ -0,0 +1,36 @@
+import uuid
+
+from sqlmodel import select
+from transcribee_backend.admin_cli.command import Command
+from transcribee_backend.db import SessionContextManager
+from transcribee_backend.helpers.compaction import compact_document
+from transcribee_backend.models.document import DocumentUpdate
+
+
+class CompactDocumentsCmd(Command):
+    def configure_parser(self, parser):
+        parser.add_argument(
+            "--uuid",
+            required=False,
+            type=uuid.UUID,
+            help="Document UUID (default: all documents)",
+        )
+
+    def run(self, args):
+        with SessionContextManager(
+            path="management_command:compact_documents"
+        ) as session:
+            if args.uuid is not None:
+                document_ids = [args.uuid]
+            else:
+                document_ids = session.exec(
+                    select(DocumentUpdate.document_id).distinct()
+                ).all()
+
+            total = 0
+            for document_id in document_ids:
+                count = compact_document(session, document_id)
+                if count:
+                    print(f"Compacted {count} changes of document {document_id}")
+                total += count
+            print(f"Compacted {total} changes in total")
@@ -1,10 +1,15 @@
 import uuid
 from pathlib import Path
 
-from sqlmodel import delete
+from sqlmodel import delete, update
 from transcribee_backend.admin_cli.command import Command
 from transcribee_backend.db import SessionContextManager
-from transcribee_backend.models.document import DocumentUpdate
+from transcribee_backend.helpers.time import now_tz_aware
+from transcribee_backend.models.document import (
+    Document,
+    DocumentSnapshot,
+    DocumentUpdate,
+)
 
 
 class SetDocumentCmd(Command):
@@ -21,8 +26,19 @@ class SetDocumentCmd(Command):
             session.exec(
                 delete(DocumentUpdate).where(DocumentUpdate.document_id == args.uuid)
             )
-            update = DocumentUpdate(
+            session.exec(
+                delete(DocumentSnapshot).where(
+                    DocumentSnapshot.document_id == args.uuid
+                )
+            )
+            document_update = DocumentUpdate(
                 change_bytes=args.FILE.read_bytes(), document_id=args.uuid
             )
-            session.add(update)
+            session.add(document_update)
+            # a new revision, so that cached exports of the old content are not used
+            session.execute(
+                update(Document)
+                .where(Document.id == args.uuid)
+                .values(changed_at=now_tz_aware())
+            )
             session.commit()
@@ -11,6 +11,7 @@ from fastapi import Depends, Header, HTTPException
 from sqlalchemy.orm import joinedload
 from sqlmodel import Session, col, or_, select
 
+from transcribee_backend.config import settings
 from transcribee_backend.db import get_session
 from transcribee_backend.exceptions import UserAlreadyExists, UserDoesNotExist
 from transcribee_backend.helpers.time import now_tz_aware
@@ -22,6 +23,13 @@ from transcribee_backend.models import (
     UserToken,
     Worker,
 )
+from transcribee_backend.util.token_cache import UserTokenCache
+
+user_token_cache = UserTokenCache(
+    settings.secret_key,
+    max_entries=settings.user_token_cache_size,
+    ttl=settings.user_token_cache_ttl,
+)
 
 
 class NotAuthorized(Exception):
@@ -71,12 +79,25 @@ def validate_user_authorization(session: Session, authorization: str):
     if ":" not in token_data:
         raise HTTPException(status_code=400, detail="Invalid Token")
     user_id, provided_token = token_data.split(":", maxsplit=1)
+
+    cached_token_id = user_token_cache.get(authorization)
+    if cached_token_id is not None:
+        # the token may have expired or been deleted by another backend process
+        statement = select(UserToken).where(
+            UserToken.id == cached_token_id, UserToken.valid_until >= now_tz_aware()
+        )
+        cached_token = session.exec(statement).one_or_none()
+        if cached_token is not None:
+            return cached_token
+        user_token_cache.invalidate_tokens([cached_token_id])
+
     statement = select(UserToken).where(
         UserToken.user_id == uuid.UUID(user_id), UserToken.valid_until >= now_tz_aware()
     )
     results = session.exec(statement)
     for token in results:
         if pw_cmp(salt=token.token_salt, hash=token.token_hash, pw=provided_token, N=5):
+            user_token_cache.put(authorization, token.id, token.user_id)
             return token
 
     raise HTTPException(status_code=401)
@@ -156,6 +177,7 @@ def change_user_password(session: Session, username: str, new_password: str) ->
     existing_user.password_salt, existing_user.password_hash = pw_hash(new_password)
     session.add(existing_user)
     session.commit()
+    user_token_cache.invalidate_user(existing_user.id)
     return existing_user
 
 
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Literal, Optional
 
 import frontmatter
 from pydantic import BaseModel, TypeAdapter
@@ -14,6 +14,18 @@ class Settings(BaseSettings):
     worker_timeout: int = 60  # in seconds
     media_signature_max_age: int = 3600  # in seconds
     task_attempt_limit: int = 5
+    # maximum time a worker may wait in `claim_unassigned_task` for a task
+    task_claim_max_wait: int = 60  # in seconds
+    # use "redis" to wake up waiting workers of all backend processes
+    task_notify_backend: Literal["local", "redis"] = "local"
+    # verified user tokens are cached, so that requests skip the scrypt comparisons
+    user_token_cache_size: int = 10000
+    user_token_cache_ttl: int = 5 * 60  # in seconds
+
+    # documents with at least this many uncompacted changes are folded into their
+    # snapshot by the periodic compaction job
+    document_compaction_threshold: int = 500
+    document_compaction_interval: int = 10 * 60  # in seconds
 
     logged_out_redirect_url: None | str = None
 
@@ -23,6 +35,29 @@ class Settings(BaseSettings):
     metrics_password: str = "transcribee"
 
     redis_url: str = "redis://localhost:6379/0"
+    # use "redis" to share live document changes between multiple backend processes
+    sync_broadcast_backend: Literal["local", "redis"] = "local"
+    # incoming document changes are written to the database in batches. With the
+    # "redis" sync backend, they are shared with other processes once they are written
+    sync_flush_interval: float = 0.5  # in seconds
+    sync_flush_batch_size: int = 100
+    # further changes are dropped while this many are waiting to be written
+    sync_max_pending_changes: int = 10000
+
+    # "local" renders exports in the backend, "worker" hands them to a worker as
+    # EXPORT tasks. Exports of documents the backend fails to load go to a worker too
+    export_backend: Literal["local", "worker"] = "local"
+    # rendered exports are cached until the document changes. Use "redis" to share the
+    # cache between multiple backend processes
+    export_cache_backend: Literal["local", "redis"] = "local"
+    export_cache_ttl: int = 60 * 60  # in seconds
+    export_cache_size: int = 1000  # number of exports kept by the local cache
+    # export requests waiting for a worker give up (and cancel the EXPORT task) after
+    # this time. Each waiting request blocks a redis connection, so their number is
+    # limited per backend process
+    export_timeout: float = 60  # in seconds
+    export_max_waits: int = 100
+    task_result_ttl: int = 5 * 60  # in seconds, for results nobody waits for anymore
 
 
 class PublicConfig(BaseModel):
@@ -6,13 +6,19 @@ from typing import Optional
 from fastapi import Request
 from prometheus_client import Histogram
 from prometheus_fastapi_instrumentator import routing
+from redis import Redis as SyncRedis
 from redis.asyncio import Redis
 from sqlalchemy import event
 from sqlmodel import Session, create_engine
 from starlette.websockets import WebSocket
 
 from transcribee_backend.config import settings
+from transcribee_backend.util.export_cache import ExportCache, RedisExportCache
 from transcribee_backend.util.redis_task_channel import RedisTaskChannel
+from transcribee_backend.util.task_notifier import (
+    RedisTaskReadyNotifier,
+    TaskReadyNotifier,
+)
 
 DEFAULT_SOCKET_PATH = Path(__file__).parent.parent.parent / "db" / "sockets"
 
@@ -27,7 +33,23 @@ engine = create_engine(
     max_overflow=1024,  # we keep open a database connection for every worker
 )
 redis = Redis.from_url(settings.redis_url)
-redis_task_channel = RedisTaskChannel(redis)
+redis_task_channel = RedisTaskChannel(
+    redis,
+    result_ttl=settings.task_result_ttl,
+    max_waits=settings.export_max_waits,
+)
+if settings.task_notify_backend == "redis":
+    task_ready_notifier = RedisTaskReadyNotifier(
+        redis, SyncRedis.from_url(settings.redis_url)
+    )
+else:
+    task_ready_notifier = TaskReadyNotifier()
+if settings.export_cache_backend == "redis":
+    export_cache = RedisExportCache(redis, ttl=settings.export_cache_ttl)
+else:
+    export_cache = ExportCache(
+        max_entries=settings.export_cache_size, ttl=settings.export_cache_ttl
+    )
 
 query_histogram = Histogram(
     "sql_queries",
@@ -41,6 +63,14 @@ def get_redis_task_channel():
     return redis_task_channel
 
 
+def get_task_ready_notifier():
+    return task_ready_notifier
+
+
+def get_export_cache():
+    return export_cache
+
+
 def get_session(request: Request):
     handler = routing.get_route_name(request)
     with Session(engine) as session, query_counter(session, path=handler):
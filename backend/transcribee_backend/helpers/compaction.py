@@ -0,0 +1,91 @@
+import logging
+import uuid
+from typing import Iterable
+
+import automerge
+from prometheus_client import Counter
+from sqlmodel import Session, col, delete, func, select
+from transcribee_backend.config import settings
+from transcribee_backend.db import SessionContextManager
+from transcribee_backend.helpers.time import now_tz_aware
+from transcribee_backend.models import DocumentSnapshot, DocumentUpdate
+
+compacted_changes_counter = Counter(
+    "transcribee_compacted_document_changes",
+    "Number of document changes folded into document snapshots",
+)
+
+
+def documents_to_compact(session: Session, threshold: int) -> Iterable[uuid.UUID]:
+    statement = (
+        select(DocumentUpdate.document_id)
+        .group_by(col(DocumentUpdate.document_id))
+        .having(func.count(col(DocumentUpdate.id)) >= max(threshold, 1))
+    )
+    return session.exec(statement).all()
+
+
+def compact_document(session: Session, document_id: uuid.UUID) -> int:
+    """
+    Fold all stored changes of a document into its snapshot.
+
+    The previous snapshot and the changes are loaded into an automerge document, which
+    is saved in its compact form as the new snapshot. Returns the number of changes
+    that were folded.
+    """
+    updates = session.exec(
+        select(DocumentUpdate)
+        .where(DocumentUpdate.document_id == document_id)
+        .with_for_update()
+    ).all()
+    if not updates:
+        return 0
+
+    snapshot = session.exec(
+        select(DocumentSnapshot)
+        .where(DocumentSnapshot.document_id == document_id)
+        .with_for_update()
+    ).one_or_none()
+    if snapshot is None:
+        snapshot = DocumentSnapshot(
+            document_id=document_id,
+            snapshot_bytes=b"",
+            compacted_at=now_tz_aware(),
+        )
+
+    # changes that can't be loaded must not be lost, so the document is loaded strictly
+    doc = automerge.load(
+        b"".join(
+            [snapshot.snapshot_bytes, *(update.change_bytes for update in updates)]
+        )
+    )
+    snapshot.snapshot_bytes = automerge.save(doc)
+    snapshot.change_count += len(updates)
+    snapshot.compacted_at = now_tz_aware()
+    session.add(snapshot)
+
+    session.exec(
+        delete(DocumentUpdate).where(
+            col(DocumentUpdate.id).in_([update.id for update in updates])
+        )
+    )
+    session.commit()
+
+    compacted_changes_counter.inc(len(updates))
+    return len(updates)
+
+
+def compact_documents(threshold: int | None = None) -> int:
+    if threshold is None:
+        threshold = settings.document_compaction_threshold
+
+    compacted = 0
+    with SessionContextManager(path="repeating_task:compact_documents") as session:
+        for document_id in documents_to_compact(session, threshold=threshold):
+            try:
+                compacted += compact_document(session, document_id)
+            except Exception as exc:
+                session.rollback()
+                logging.error(f"Compacting document {document_id} failed", exc_info=exc)
+
+    return compacted
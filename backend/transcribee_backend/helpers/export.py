@@ -0,0 +1,53 @@
+import uuid
+
+import automerge
+from sqlmodel import Session, select
+from transcribee_backend.helpers.sync import document_update_writer
+from transcribee_backend.models import DocumentSnapshot, DocumentUpdate
+from transcribee_proto.api import ExportFormat, ExportTaskParameters
+from transcribee_proto.document import Document as EditorDocument
+from transcribee_proto.webvtt.export_webvtt import generate_web_vtt
+from transcribee_proto.webvtt.webvtt_writer import SubtitleFormat
+
+
+def load_document_changes(session: Session, document_id: uuid.UUID) -> bytes:
+    """
+    Returns all stored changes of a document (including the ones not yet written to the
+    database by this process), concatenated so that automerge can load them at once.
+    """
+    pending = document_update_writer.pending_changes(document_id)
+    # The updates are selected before the snapshot: If a compaction runs in between,
+    # we load some changes twice (which automerge ignores) instead of missing them
+    updates = session.exec(
+        select(DocumentUpdate.change_bytes).where(
+            DocumentUpdate.document_id == document_id
+        )
+    ).all()
+    snapshot = session.exec(
+        select(DocumentSnapshot.snapshot_bytes).where(
+            DocumentSnapshot.document_id == document_id
+        )
+    ).one_or_none()
+    return b"".join([snapshot or b"", *updates, *pending])
+
+
+def materialize_document(changes: bytes) -> EditorDocument:
+    load_options = automerge.LoadOptions()
+    load_options.on_partial_load = automerge.OnPartialLoad.Ignore
+    doc = automerge.load_with_options(changes, load_options)
+    # documents are initialized by the first worker that opens them
+    return EditorDocument.model_validate(
+        {"children": [], "speaker_names": {}, **automerge.dump(doc)}
+    )
+
+
+def render_export(doc: EditorDocument, params: ExportTaskParameters) -> str:
+    vtt = generate_web_vtt(
+        doc,
+        params.include_speaker_names,
+        params.include_word_timing,
+        params.max_line_length,
+    )
+    if params.format == ExportFormat.SRT:
+        return vtt.to_string(SubtitleFormat.SRT)
+    return vtt.to_string(SubtitleFormat.VTT)
@@ -1,14 +1,20 @@
 import asyncio
+import logging
+import uuid
 from asyncio import Queue
-from typing import Callable
+from typing import Callable, Optional
 
 from fastapi import WebSocket, WebSocketDisconnect
-from sqlmodel import Session, select
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+from sqlmodel import Session, col, insert, select, update
 from starlette.websockets import WebSocketState
+from transcribee_backend.config import settings
+from transcribee_backend.db import SessionContextManager, redis
 from transcribee_backend.helpers.time import now_tz_aware
 from transcribee_proto.sync import SyncMessageType
 
-from ..models import Document, DocumentUpdate
+from ..models import Document, DocumentSnapshot, DocumentUpdate
 
 
 class DocumentSyncManager:
@@ -16,19 +22,261 @@ class DocumentSyncManager:
         self.handlers: dict[str, set[Callable]] = {}
 
     async def broadcast(self, channel: str, message: bytes):
-        for handler in self.handlers[channel]:
+        await self._broadcast_local(channel, message)
+
+    async def publish_written(self, changes: dict[uuid.UUID, list[bytes]]):
+        # all handlers are local and already received the changes in `broadcast`
+        pass
+
+    async def _broadcast_local(self, channel: str, message: bytes):
+        # copy the handlers, they might (un-)subscribe while we are awaiting
+        for handler in list(self.handlers.get(channel, ())):
             await handler(channel, message)
 
-    def subscribe(self, channel: str, handler: Callable):
+    async def subscribe(self, channel: str, handler: Callable):
         self.handlers.setdefault(channel, set())
         self.handlers[channel].add(handler)
 
-    def unsubscribe(self, channel: str, handler):
+    async def unsubscribe(self, channel: str, handler):
         self.handlers.setdefault(channel, set())
         self.handlers[channel].remove(handler)
+        if not self.handlers[channel]:
+            del self.handlers[channel]
+
+
+class RedisDocumentSyncManager(DocumentSyncManager):
+    """
+    Fans out broadcasts to all backend processes via redis pub/sub.
+
+    Each process holds one redis subscription per document that has local handlers.
+    Messages are delivered to local handlers directly and published with the id of this
+    process, so that the process can skip its own messages when they come back from
+    redis.
+
+    Connections load everything that was published before they subscribed from the
+    database, so document changes are only published by `publish_written` once the
+    `DocumentUpdateWriter` has written them. Local handlers receive them immediately.
+    """
+
+    redis: Redis
+    prefix: str
+
+    def __init__(self, redis: Redis, prefix="document-sync:"):
+        super().__init__()
+        self.redis = redis
+        self.prefix = prefix
+        self._origin = uuid.uuid4().bytes
+        self._pubsub: Optional[PubSub] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def publish_written(self, changes: dict[uuid.UUID, list[bytes]]):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for document_id, messages in changes.items():
+                for message in messages:
+                    pipe.publish(
+                        self._redis_channel(str(document_id)), self._origin + message
+                    )
+            await pipe.execute()
+
+    async def subscribe(self, channel: str, handler: Callable):
+        is_new_channel = channel not in self.handlers
+        await super().subscribe(channel, handler)
+        if is_new_channel:
+            if self._pubsub is None:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            await self._pubsub.subscribe(self._redis_channel(channel))
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read_messages(self._pubsub))
+
+    async def unsubscribe(self, channel: str, handler):
+        await super().unsubscribe(channel, handler)
+        if channel not in self.handlers and self._pubsub is not None:
+            await self._pubsub.unsubscribe(self._redis_channel(channel))
+
+    async def _read_messages(self, pubsub: PubSub):
+        while True:
+            try:
+                message = await pubsub.get_message(timeout=1.0)
+                if message is None or message["type"] != "message":
+                    continue
+
+                data: bytes = message["data"]
+                origin, data = data[: len(self._origin)], data[len(self._origin) :]
+                if origin == self._origin:
+                    continue
+
+                channel = message["channel"].decode()[len(self.prefix) :]
+                await self._broadcast_local(channel, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logging.error("Reading document sync messages failed", exc_info=exc)
+                await asyncio.sleep(1)
+
+    def _redis_channel(self, channel: str):
+        return self.prefix + channel
+
+
+def get_sync_manager() -> DocumentSyncManager:
+    if settings.sync_broadcast_backend == "redis":
+        return RedisDocumentSyncManager(redis)
+    return DocumentSyncManager()
+
+
+sync_manager = get_sync_manager()
+
+
+class DocumentUpdateWriter:
+    """
+    Coalesces incoming document changes into batched database writes.
 
+    Changes are buffered per document and written with one multi-row insert (and a
+    single `Document.changed_at` update per document) when `batch_size` changes are
+    pending or when `flush` is called by the periodic flush task. Written changes are
+    passed on to `sync_manager.publish_written`.
 
-sync_manager = DocumentSyncManager()
+    If the batch cannot be written, the documents are written one by one, so that a
+    single document cannot block the others. Changes of deleted documents are dropped,
+    other failing documents are retried up to `max_attempts` times. At most
+    `max_pending` changes are buffered, e.g. while the database is unavailable.
+    """
+
+    def __init__(self, batch_size: int, max_pending: int, max_attempts: int = 5):
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending: dict[uuid.UUID, list[bytes]] = {}
+        self._pending_count = 0
+        self._attempts: dict[uuid.UUID, int] = {}
+        # changes are published in the order they were written
+        self._lock = asyncio.Lock()
+
+    def pending_changes(self, document_id: uuid.UUID) -> list[bytes]:
+        return list(self._pending.get(document_id, ()))
+
+    async def add(self, document_id: uuid.UUID, change: bytes):
+        if self._pending_count >= self.max_pending:
+            logging.error(
+                f"Dropping change of document {document_id}, too many changes are"
+                " waiting to be written"
+            )
+            return
+        self._pending.setdefault(document_id, []).append(change)
+        self._pending_count += 1
+        if self._pending_count >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            # Nothing is awaited until the changes are written, so no changes can be
+            # added while we write
+            if not self._pending:
+                return
+            with SessionContextManager(path="sync:flush_document_updates") as session:
+                written = self.write_pending(session)
+            if not written:
+                return
+            try:
+                await sync_manager.publish_written(written)
+            except Exception as exc:
+                # the changes are written, so clients that connect later still get them
+                logging.error("Publishing document changes failed", exc_info=exc)
+
+    def write_pending(self, session: Session) -> dict[uuid.UUID, list[bytes]]:
+        """
+        Writes the pending changes and returns the ones that were written.
+        """
+        pending, self._pending = self._pending, {}
+        self._pending_count = 0
+        try:
+            self._write(session, pending)
+            written = list(pending)
+        except Exception:
+            session.rollback()
+            written = []
+            failed: dict[uuid.UUID, Exception] = {}
+            for document_id, changes in pending.items():
+                try:
+                    self._write(session, {document_id: changes})
+                    written.append(document_id)
+                except Exception as exc:
+                    session.rollback()
+                    failed[document_id] = exc
+            for document_id, exc in failed.items():
+                self._retry_or_drop(
+                    session,
+                    document_id,
+                    pending[document_id],
+                    exc,
+                    # if no document can be written, the database is probably
+                    # unavailable, which is no reason to give up on the changes
+                    count_attempt=bool(written),
+                )
+        for document_id in written:
+            self._attempts.pop(document_id, None)
+        return {document_id: pending[document_id] for document_id in written}
+
+    def _write(self, session: Session, pending: dict[uuid.UUID, list[bytes]]):
+        session.execute(
+            insert(DocumentUpdate),
+            [
+                {
+                    "id": uuid.uuid4(),
+                    "document_id": document_id,
+                    "change_bytes": change,
+                }
+                for document_id, changes in pending.items()
+                for change in changes
+            ],
+        )
+        session.execute(
+            update(Document)
+            .where(col(Document.id).in_(pending.keys()))
+            .values(changed_at=now_tz_aware())
+        )
+        session.commit()
+
+    def _retry_or_drop(
+        self,
+        session: Session,
+        document_id: uuid.UUID,
+        changes: list[bytes],
+        exc: Exception,
+        count_attempt: bool,
+    ):
+        try:
+            exists = session.get(Document, document_id) is not None
+        except Exception:
+            session.rollback()
+            exists = True
+
+        attempts = self._attempts.get(document_id, 0) + int(count_attempt)
+        if not exists:
+            logging.warning(
+                f"Dropping {len(changes)} changes of deleted document {document_id}"
+            )
+        elif attempts >= self.max_attempts:
+            logging.error(
+                f"Dropping {len(changes)} changes of document {document_id}, writing"
+                f" them failed {attempts} times",
+                exc_info=exc,
+            )
+        else:
+            logging.error(
+                f"Writing changes of document {document_id} failed", exc_info=exc
+            )
+            self._attempts[document_id] = attempts
+            # keep the changes for the next flush
+            self._pending[document_id] = changes
+            self._pending_count += len(changes)
+            return
+        self._attempts.pop(document_id, None)
+
+
+document_update_writer = DocumentUpdateWriter(
+    batch_size=settings.sync_flush_batch_size,
+    max_pending=settings.sync_max_pending_changes,
+)
 
 
 class DocumentSyncConsumer:
@@ -46,9 +294,9 @@ class DocumentSyncConsumer:
         self._subscribed = set()
         self._msg_queue = Queue()
 
-    def subscribe(self, channel: str):
+    async def subscribe(self, channel: str):
         self._subscribed.add(channel)
-        sync_manager.subscribe(channel, self.handle_incoming_broadcast)
+        await sync_manager.subscribe(channel, self.handle_incoming_broadcast)
 
     async def handle_incoming_broadcast(self, channel: str, message: bytes):
         if channel in self._subscribed:
@@ -59,7 +307,19 @@ class DocumentSyncConsumer:
             await self.on_message(await self._ws.receive_bytes())
 
     async def broadcast_sender(self):
-        statement = select(DocumentUpdate).where(DocumentUpdate.document == self._doc)
+        # Changes that are not yet written by this process
+        pending = document_update_writer.pending_changes(self._doc.id)
+        statement = select(DocumentUpdate.change_bytes).where(
+            DocumentUpdate.document_id == self._doc.id
+        )
+        # The updates are selected before the snapshot: If a compaction runs in between,
+        # we send some changes twice (which automerge ignores) instead of missing them
+        updates = self._session.exec(statement).all()
+        snapshot = self._session.exec(
+            select(DocumentSnapshot.snapshot_bytes).where(
+                DocumentSnapshot.document_id == self._doc.id
+            )
+        ).one_or_none()
 
         # START:
         # Create a message as a list of bytes is hacky and only works for sure when using uvicorn
@@ -74,8 +334,10 @@ class DocumentSyncConsumer:
         # bytes here instead of just bytes as would be allowed by the asgi spec:
         # https://asgi.readthedocs.io/en/latest/specs/www.html#send-send-event
         message = [bytes([SyncMessageType.FULL_DOCUMENT])]
-        for update in self._session.exec(statement):
-            message.append(update.change_bytes)
+        if snapshot:
+            message.append(snapshot)
+        message.extend(updates)
+        message.extend(pending)
         await self._ws.send_bytes(message)  # type: ignore
         # END
 
@@ -87,7 +349,7 @@ class DocumentSyncConsumer:
 
     async def run(self):
         await self._ws.accept()
-        self.subscribe(str(self._doc.id))
+        await self.subscribe(str(self._doc.id))
         pending = {
             asyncio.create_task(self.listener()),
             asyncio.create_task(self.broadcast_sender()),
@@ -105,10 +367,15 @@ class DocumentSyncConsumer:
         await self.disconnect()
 
     async def disconnect(self, code=1000):
-        for ch in self._subscribed:
-            sync_manager.unsubscribe(ch, self.handle_incoming_broadcast)
-        if self._ws.client_state == WebSocketState.CONNECTED:
-            await self._ws.close(code=code)
+        try:
+            # make sure that all changes of this connection are persisted
+            await document_update_writer.flush()
+        finally:
+            for ch in self._subscribed:
+                await sync_manager.unsubscribe(ch, self.handle_incoming_broadcast)
+            self._subscribed.clear()
+            if self._ws.client_state == WebSocketState.CONNECTED:
+                await self._ws.close(code=code)
 
     async def on_broadcast(self, channel: str, message: bytes):
         if channel == str(self._doc.id):
@@ -119,11 +386,5 @@ class DocumentSyncConsumer:
             await self.disconnect(code=1008)  # 1008 = POLICY VIOLATION
             return
 
-        update = DocumentUpdate(change_bytes=message, document_id=self._doc.id)
-        self._session.add(update)
-
-        self._doc.changed_at = now_tz_aware()
-        self._session.add(self._doc)
-
-        self._session.commit()
         await sync_manager.broadcast(str(self._doc.id), message)
+        await document_update_writer.add(self._doc.id, message)
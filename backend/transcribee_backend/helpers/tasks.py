@@ -3,8 +3,9 @@ from typing import Iterable, Optional
 
 from prometheus_client import Counter
 from sqlmodel import Session, col, select
+from transcribee_backend.auth import user_token_cache
 from transcribee_backend.config import settings
-from transcribee_backend.db import SessionContextManager
+from transcribee_backend.db import SessionContextManager, task_ready_notifier
 from transcribee_backend.helpers.time import now_tz_aware
 from transcribee_backend.models import UserToken
 from transcribee_backend.models.task import Task, TaskAttempt, TaskState
@@ -54,6 +55,10 @@ def finish_current_attempt(
     session.add(task)
     session.commit()
 
+    # the task can be retried or tasks depending on it might be ready now
+    if task.state != TaskState.FAILED:
+        task_ready_notifier.notify()
+
 
 def timeouted_tasks(session: Session) -> Iterable[Task]:
     statement = (
@@ -87,7 +92,10 @@ def expired_tokens(session: Session) -> Iterable[UserToken]:
 
 def remove_expired_tokens():
     with SessionContextManager(path="repeating_task:remove_expired_tokens") as session:
+        removed_token_ids = []
         for user_token in expired_tokens(session):
             session.delete(user_token)
+            removed_token_ids.append(user_token.id)
 
         session.commit()
+        user_token_cache.invalidate_tokens(removed_token_ids)
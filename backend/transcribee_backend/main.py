@@ -6,7 +6,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
 
 from transcribee_backend.config import settings
+from transcribee_backend.helpers.compaction import compact_documents
 from transcribee_backend.helpers.periodic_tasks import run_periodic
+from transcribee_backend.helpers.sync import document_update_writer
 from transcribee_backend.helpers.tasks import remove_expired_tokens, timeout_attempts
 from transcribee_backend.metrics import init_metrics, metrics_auth, refresh_metrics
 from transcribee_backend.routers.config import config_router
@@ -29,6 +31,16 @@ async def setup_periodic_tasks():
             run_periodic(remove_expired_tokens, seconds=60 * 60)
         ),  # 1 hour
         asyncio.create_task(run_periodic(refresh_metrics, seconds=1)),
+        asyncio.create_task(
+            run_periodic(
+                compact_documents, seconds=settings.document_compaction_interval
+            )
+        ),
+        asyncio.create_task(
+            run_periodic(
+                document_update_writer.flush, seconds=settings.sync_flush_interval
+            )
+        ),
     ]
 
 
@@ -38,6 +50,7 @@ async def lifespan(_: FastAPI):
     yield
     for task in tasks:
         task.cancel()
+    await document_update_writer.flush()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -5,6 +5,7 @@ from .document import (
     DocumentMediaTag,
     DocumentShareToken,
     DocumentShareTokenBase,
+    DocumentSnapshot,
     DocumentUpdate,
 )
 from .task import (
@@ -26,6 +27,7 @@ __all__ = [
     "DocumentMediaTag",
     "DocumentShareToken",
     "DocumentShareTokenBase",
+    "DocumentSnapshot",
     "DocumentUpdate",
     "AssignedTaskResponse",
     "CreateTask",
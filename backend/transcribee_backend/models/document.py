@@ -39,6 +39,9 @@ class Document(DocumentBase, table=True):
     updates: List["DocumentUpdate"] = Relationship(
         sa_relationship_kwargs={"cascade": "all"}
     )
+    snapshot: Mapped[Optional["DocumentSnapshot"]] = Relationship(
+        sa_relationship_kwargs={"cascade": "all", "uselist": False}
+    )
     share_tokens: List["DocumentShareToken"] = Relationship(
         sa_relationship_kwargs={"cascade": "all"}
     )
@@ -123,6 +126,30 @@ class DocumentUpdate(DocumentUpdateBase, table=True):
     document: Document = Relationship(back_populates="updates")
 
 
+class DocumentSnapshot(SQLModel, table=True):
+    """
+    Compacted form of the change log of a document.
+
+    `snapshot_bytes` holds the saved automerge document with all `DocumentUpdate`s
+    that have been folded into it, so that clients only need to receive the snapshot
+    and the updates written after the last compaction.
+    """
+
+    id: uuid.UUID = Field(
+        default_factory=uuid.uuid4,
+        primary_key=True,
+        index=True,
+        nullable=False,
+    )
+    document_id: uuid.UUID = Field(foreign_key="document.id", unique=True)
+    document: Document = Relationship(back_populates="snapshot")
+    snapshot_bytes: bytes
+    change_count: int = 0
+    compacted_at: AwareDatetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+
+
 class DocumentShareTokenBase(SQLModel):
     id: uuid.UUID
     name: str
@@ -4,6 +4,7 @@ import uuid
 from dataclasses import dataclass
 from typing import Any, Dict, List, Literal, Optional
 
+from sqlalchemy import Index, text
 from sqlalchemy.orm import Mapped
 from sqlmodel import JSON, Column, Field, ForeignKey, Relationship, SQLModel, Uuid
 from transcribee_proto.api import ExportTaskParameters, TaskType
@@ -42,14 +43,30 @@ class TaskDependency(SQLModel, table=True):
     )
 
     dependent_task_id: uuid.UUID = Field(
-        foreign_key="task.id", ondelete="CASCADE", unique=False
+        foreign_key="task.id", ondelete="CASCADE", unique=False, index=True
     )
     dependant_on_id: uuid.UUID = Field(
         foreign_key="task.id", ondelete="CASCADE", unique=False
     )
 
 
+# Predicate of the partial index over tasks that can still be claimed or are running.
+# Queries that should use the index need to filter for exactly these states.
+OPEN_TASK_STATES = (TaskState.NEW, TaskState.ASSIGNED)
+OPEN_TASK_INDEX_WHERE = text("state IN ('NEW', 'ASSIGNED')")
+
+
 class Task(TaskBase, table=True):
+    __table_args__ = (
+        Index(
+            "ix_task_open_task_type_state",
+            "task_type",
+            "state",
+            postgresql_where=OPEN_TASK_INDEX_WHERE,
+            sqlite_where=OPEN_TASK_INDEX_WHERE,
+        ),
+    )
+
     id: uuid.UUID = Field(
         default_factory=uuid.uuid4,
         primary_key=True,
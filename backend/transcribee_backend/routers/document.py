@@ -1,5 +1,6 @@
 import datetime
 import enum
+import logging
 import pathlib
 import uuid
 from dataclasses import dataclass
@@ -26,6 +27,7 @@ from pydantic import BaseModel, TypeAdapter
 from sqlalchemy.orm import selectinload
 from sqlalchemy.sql.expression import desc
 from sqlmodel import Session, col, select
+from starlette.concurrency import run_in_threadpool
 from transcribee_proto.api import DocumentWithAccessInfo as ApiDocumentWithAccessInfo
 from transcribee_proto.api import ExportTaskParameters, RemoteDocumentMedia
 
@@ -38,19 +40,34 @@ from transcribee_backend.auth import (
 )
 from transcribee_backend.config import settings
 from transcribee_backend.db import (
+    get_export_cache,
     get_redis_task_channel,
     get_session,
     get_session_ws,
+    get_task_ready_notifier,
+)
+from transcribee_backend.helpers.export import (
+    load_document_changes,
+    materialize_document,
+    render_export,
+)
+from transcribee_backend.helpers.sync import (
+    DocumentSyncConsumer,
+    document_update_writer,
 )
-from transcribee_backend.helpers.sync import DocumentSyncConsumer
 from transcribee_backend.helpers.time import now_tz_aware
 from transcribee_backend.models.document import (
     ApiDocumentWithTasks,
     DocumentShareTokenBase,
 )
-from transcribee_backend.models.task import TaskAttempt, TaskResponse
+from transcribee_backend.models.task import TaskAttempt, TaskResponse, TaskState
 from transcribee_backend.util.base_url import BaseUrl, get_base_url
-from transcribee_backend.util.redis_task_channel import RedisTaskChannel
+from transcribee_backend.util.export_cache import ExportCache
+from transcribee_backend.util.redis_task_channel import (
+    RedisTaskChannel,
+    TaskChannelFull,
+)
+from transcribee_backend.util.task_notifier import TaskReadyNotifier
 
 from .. import media_storage
 from ..models import (
@@ -320,6 +337,7 @@ async def create_document(
     session: Session = Depends(get_session),
     token: UserToken = Depends(get_user_token),
     baseUrl: BaseUrl = Depends(get_base_url),
+    task_ready_notifier: TaskReadyNotifier = Depends(get_task_ready_notifier),
 ) -> ApiDocumentWithTasks:
     if language not in languages:
         raise RequestValidationError(
@@ -359,6 +377,7 @@ async def create_document(
     )
 
     session.commit()
+    task_ready_notifier.notify()
     return document.as_api_document(baseUrl=baseUrl)
 
 
@@ -369,6 +388,7 @@ def import_document(
     session: Session = Depends(get_session),
     name: str = Form(),
     baseUrl: BaseUrl = Depends(get_base_url),
+    task_ready_notifier: TaskReadyNotifier = Depends(get_task_ready_notifier),
 ) -> ApiDocumentWithTasks:
     document = Document(
         name=name,
@@ -403,6 +423,7 @@ def import_document(
     session.add(reencode_task)
 
     session.commit()
+    task_ready_notifier.notify()
     return document.as_api_document(baseUrl=baseUrl)
 
 
@@ -641,22 +662,114 @@ async def export(
     auth: AuthInfo = Depends(get_doc_min_readonly_auth),
     redis_task_channel: RedisTaskChannel = Depends(get_redis_task_channel),
     session: Session = Depends(get_session),
+    task_ready_notifier: TaskReadyNotifier = Depends(get_task_ready_notifier),
+    export_cache: ExportCache = Depends(get_export_cache),
 ):
+    # The revision is read before the document: If it changes in between, the export
+    # is cached for the old revision and never used. Changes this process has not
+    # written yet are not part of the revision, so these documents are not cached
+    revision = auth.document.changed_at.isoformat()
+    use_cache = not document_update_writer.pending_changes(auth.document.id)
+    result = None
+    if use_cache:
+        result = await export_cache.get(auth.document.id, revision, export_parameters)
+        if result is not None:
+            return result
+
+    if settings.export_backend == "local":
+        try:
+            changes = load_document_changes(session, auth.document.id)
+            doc = await run_in_threadpool(materialize_document, changes)
+        except Exception as exc:
+            logging.warning(
+                "Loading document for export failed, falling back to worker",
+                exc_info=exc,
+            )
+        else:
+            result = await run_in_threadpool(render_export, doc, export_parameters)
+
+    if result is None:
+        result = await export_with_worker(
+            auth.document.id,
+            export_parameters,
+            session,
+            redis_task_channel,
+            task_ready_notifier,
+        )
+
+    if use_cache:
+        await export_cache.put(auth.document.id, revision, export_parameters, result)
+    return result
+
+
+async def export_with_worker(
+    document_id: uuid.UUID,
+    export_parameters: ExportTaskParameters,
+    session: Session,
+    redis_task_channel: RedisTaskChannel,
+    task_ready_notifier: TaskReadyNotifier,
+) -> str:
+    # The wait is reserved before the task is created, so that rejected requests
+    # neither write to the database nor hand out tasks to workers
+    try:
+        with redis_task_channel.reserve_wait():
+            raw_result = await run_export_task(
+                document_id,
+                export_parameters,
+                session,
+                redis_task_channel,
+                task_ready_notifier,
+            )
+    except TaskChannelFull:
+        raise HTTPException(status_code=503, detail="Too many exports in progress")
+
+    result = TypeAdapter(ExportRes).validate_json(raw_result)
+    if isinstance(result, ExportError):
+        raise Exception(result.error)
+    else:
+        return result.result
+
+
+async def run_export_task(
+    document_id: uuid.UUID,
+    export_parameters: ExportTaskParameters,
+    session: Session,
+    redis_task_channel: RedisTaskChannel,
+    task_ready_notifier: TaskReadyNotifier,
+) -> str:
     export_task = Task(
         task_type=TaskType.EXPORT,
         task_parameters=export_parameters.model_dump(),
-        document_id=auth.document.id,
+        document_id=document_id,
     )
     session.add(export_task)
     session.commit()
+    task_ready_notifier.notify()
 
-    result = TypeAdapter(ExportRes).validate_json(
-        await redis_task_channel.wait_for_result(str(export_task.id))
-    )
-    if isinstance(result, ExportError):
-        raise Exception(result.error)
-    else:
-        return result.result
+    try:
+        raw_result = await redis_task_channel.wait_for_result(
+            str(export_task.id), timeout=settings.export_timeout
+        )
+    except BaseException:
+        # e.g. the client went away, nobody is interested in the result anymore
+        cancel_export_task(session, export_task.id)
+        raise
+
+    if raw_result is None:
+        cancel_export_task(session, export_task.id)
+        raise HTTPException(status_code=504, detail="Export timed out")
+    return raw_result
+
+
+def cancel_export_task(session: Session, task_id: uuid.UUID):
+    """
+    Deletes the EXPORT task, unless a worker already completed it. A worker currently
+    running it stops once its next keepalive fails.
+    """
+    task = session.get(Task, task_id)
+    if task is not None and task.state != TaskState.COMPLETED:
+        session.delete(task)
+        session.commit()
 
 
 @document_router.post("/{document_id}/add_export_result/")
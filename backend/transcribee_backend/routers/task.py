@@ -1,4 +1,6 @@
+import asyncio
 import datetime
+import time
 from typing import Dict, List, Optional
 
 from fastapi import APIRouter, Body, Depends, Query
@@ -6,6 +8,7 @@ from fastapi.exceptions import HTTPException
 from sqlalchemy.orm import aliased, joinedload, selectinload
 from sqlalchemy.sql.operators import is_
 from sqlmodel import Session, col, select
+from starlette.concurrency import run_in_threadpool
 from transcribee_proto.api import KeepaliveBody
 
 from transcribee_backend.auth import (
@@ -13,12 +16,18 @@ from transcribee_backend.auth import (
     get_authorized_task,
     get_authorized_worker,
 )
-from transcribee_backend.db import get_session
+from transcribee_backend.config import settings
+from transcribee_backend.db import get_session, get_task_ready_notifier
 from transcribee_backend.helpers.tasks import finish_current_attempt
 from transcribee_backend.helpers.time import now_tz_aware
 from transcribee_backend.models.api import ApiToken
-from transcribee_backend.models.task import TaskQueueInfoResponse, TaskState
+from transcribee_backend.models.task import (
+    OPEN_TASK_STATES,
+    TaskQueueInfoResponse,
+    TaskState,
+)
 from transcribee_backend.util.base_url import BaseUrl, get_base_url
+from transcribee_backend.util.task_notifier import TaskReadyNotifier
 
 from ..models import (
     AssignedTaskResponse,
@@ -42,10 +51,12 @@ def create_task(
     task: CreateTask,
     session: Session = Depends(get_session),
     token: UserToken = Depends(get_user_token),
+    task_ready_notifier: TaskReadyNotifier = Depends(get_task_ready_notifier),
 ) -> TaskResponse:
     db_task = Task.from_orm(task)
     session.add(db_task)
     session.commit()
+    task_ready_notifier.notify()
     return TaskResponse.from_orm(db_task)
 
 
@@ -63,35 +74,40 @@ def get_ready_task(session: Session, task_type: List[TaskType]) -> Optional[Task
         )
     ).exists()
 
+    # Filtering for the open states (instead of excluding the finished ones) allows
+    # postgres to use the partial index over open tasks.
+    # Rows locked by concurrently claiming workers are skipped, so that workers don't
+    # serialize on the same task.
     statement = (
         select(Task)
         .where(
             col(Task.task_type).in_(task_type),
             is_(col(Task.current_attempt_id), None),
-            ~(col(Task.state).in_([TaskState.COMPLETED, TaskState.FAILED])),
+            col(Task.state).in_(OPEN_TASK_STATES),
             ~blocking_tasks_exist,
         )
-        .with_for_update()
+        .limit(1)
+        .with_for_update(skip_locked=True)
     )
     return session.exec(statement).first()
 
 
-@task_router.post("/claim_unassigned_task/")
-def claim_unassigned_task(
-    session: Session = Depends(get_session),
-    authorized_worker: Worker = Depends(get_authorized_worker),
-    task_type: List[TaskType] = Query(),
-    now: datetime.datetime = Depends(now_tz_aware),
-    baseUrl: BaseUrl = Depends(get_base_url),
+def claim_ready_task(
+    session: Session,
+    worker: Worker,
+    task_type: List[TaskType],
+    baseUrl: BaseUrl,
 ) -> Optional[AssignedTaskResponse]:
     task = get_ready_task(session, task_type)
     if task is None:
+        session.rollback()  # release the (empty) transaction until we try again
         return
 
+    now = now_tz_aware()
     attempt = TaskAttempt(
         task_id=task.id,
         started_at=now,
-        assigned_worker=authorized_worker,
+        assigned_worker=worker,
         last_keepalive=now,
         attempt_number=task.attempt_counter + 1,
     )
@@ -106,6 +122,48 @@ def claim_unassigned_task(
     return AssignedTaskResponse.from_orm(task, baseUrl=baseUrl)
 
 
+# Waiting claims look for tasks again after this many seconds, even if they were not
+# notified. This catches tasks that became ready without a notification, e.g. through
+# the admin cli
+CLAIM_RECHECK_INTERVAL = 10  # in seconds
+
+
+@task_router.post("/claim_unassigned_task/")
+async def claim_unassigned_task(
+    session: Session = Depends(get_session),
+    authorized_worker: Worker = Depends(get_authorized_worker),
+    task_type: List[TaskType] = Query(),
+    wait: float = Query(default=0, ge=0),
+    baseUrl: BaseUrl = Depends(get_base_url),
+    task_ready_notifier: TaskReadyNotifier = Depends(get_task_ready_notifier),
+) -> Optional[AssignedTaskResponse]:
+    """
+    Claims a ready task of one of the given types.
+
+    If no task is ready, the request is held for up to `wait` seconds until a task
+    becomes ready (long polling). Longer waits are shortened to the maximum wait
+    configured on the server.
+    """
+    deadline = time.monotonic() + min(wait, settings.task_claim_max_wait)
+    while True:
+        # listen before looking for a task, so that we don't miss a notification
+        # that is sent in between
+        with task_ready_notifier.listen() as task_ready:
+            task = await run_in_threadpool(
+                claim_ready_task, session, authorized_worker, task_type, baseUrl
+            )
+            remaining = deadline - time.monotonic()
+            if task is not None or remaining <= 0:
+                return task
+
+            try:
+                await asyncio.wait_for(
+                    task_ready.wait(), timeout=min(remaining, CLAIM_RECHECK_INTERVAL)
+                )
+            except asyncio.TimeoutError:
+                pass
+
+
 @task_router.get("/queue_info/")
 def queue_info(
     session: Session = Depends(get_session),
@@ -127,7 +185,7 @@ def queue_info(
     statement = (
         select(Task)
         .where(
-            ~(col(Task.state).in_([TaskState.COMPLETED, TaskState.FAILED])),
+            col(Task.state).in_(OPEN_TASK_STATES),
             ~blocking_tasks_exist,
         )
         .options(joinedload(Task.document))
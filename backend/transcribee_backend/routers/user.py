@@ -11,6 +11,7 @@ from transcribee_backend.auth import (
     create_user,
     generate_user_token,
     get_user_token,
+    user_token_cache,
 )
 from transcribee_backend.db import get_session
 from transcribee_backend.exceptions import UserAlreadyExists
@@ -57,6 +58,7 @@ def logout(
 ) -> None:
     session.delete(token)
     session.commit()
+    user_token_cache.invalidate_tokens([token.id])
 
 
 @user_router.get("/me/")
@@ -86,4 +88,5 @@ def change_password(
     )
     session.exec(delete(UserToken).where(col(UserToken.user_id) == authorized_user.id))
     session.commit()
+    user_token_cache.invalidate_user(authorized_user.id)
     return UserBase(username=user.username)
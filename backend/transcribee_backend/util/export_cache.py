@@ -0,0 +1,94 @@
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from redis.asyncio import Redis
+from transcribee_proto.api import ExportTaskParameters
+
+
+class ExportCache:
+    """
+    Caches rendered exports, keyed by document, document revision and export parameters.
+
+    The revision is read from the database by the caller (e.g. `Document.changed_at`),
+    so that new changes of the document make all older exports unreachable, no matter
+    which process wrote them. Entries expire after `ttl` seconds and at most
+    `max_entries` are kept, the least recently used ones are evicted first.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    async def get(
+        self, document_id: uuid.UUID, revision: str, params: ExportTaskParameters
+    ) -> Optional[str]:
+        key = self._key(document_id, revision, params)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    async def put(
+        self,
+        document_id: uuid.UUID,
+        revision: str,
+        params: ExportTaskParameters,
+        result: str,
+    ):
+        key = self._key(document_id, revision, params)
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _key(
+        self, document_id: uuid.UUID, revision: str, params: ExportTaskParameters
+    ) -> str:
+        params_hash = hashlib.sha256(params.model_dump_json().encode()).hexdigest()
+        return f"{document_id}:{revision}:{params_hash}"
+
+
+class RedisExportCache(ExportCache):
+    """
+    Stores the exports in redis, so that they are shared by all backend processes.
+    Eviction beyond the ttl is left to the redis memory policy.
+    """
+
+    redis: Redis
+    prefix: str
+
+    def __init__(self, redis: Redis, ttl: float, prefix="export-cache:"):
+        super().__init__(max_entries=0, ttl=ttl)
+        self.redis = redis
+        self.prefix = prefix
+
+    async def get(
+        self, document_id: uuid.UUID, revision: str, params: ExportTaskParameters
+    ) -> Optional[str]:
+        result = await self.redis.get(self._key(document_id, revision, params))
+        return result.decode() if result is not None else None
+
+    async def put(
+        self,
+        document_id: uuid.UUID,
+        revision: str,
+        params: ExportTaskParameters,
+        result: str,
+    ):
+        await self.redis.set(
+            self._key(document_id, revision, params), result, ex=int(self.ttl)
+        )
+
+    def _key(
+        self, document_id: uuid.UUID, revision: str, params: ExportTaskParameters
+    ) -> str:
+        return self.prefix + super()._key(document_id, revision, params)
@@ -1,21 +1,80 @@
+from contextlib import contextmanager
+from typing import Optional
+
+from prometheus_client import Gauge
 from redis.asyncio import Redis
 
+waiting_for_result_gauge = Gauge(
+    "transcribee_task_channel_waits",
+    "Requests currently waiting for a task result",
+)
+
+
+class TaskChannelFull(Exception):
+    pass
+
 
 class RedisTaskChannel:
+    """
+    Passes task results from the request that receives them to the request waiting for
+    them.
+
+    Every waiting request blocks a redis connection, so at most `max_waits` requests of
+    this process may wait at the same time. Requests reserve their wait with
+    `reserve_wait` before they start the task. Results that nobody picks up expire
+    after `result_ttl` seconds.
+    """
+
     redis: Redis
     prefix: str
 
-    def __init__(self, redis, prefix="task-channel:"):
+    def __init__(
+        self,
+        redis,
+        prefix="task-channel:",
+        result_ttl: int = 5 * 60,
+        max_waits: int = 100,
+    ):
         self.redis = redis
         self.prefix = prefix
+        self.result_ttl = result_ttl
+        self.max_waits = max_waits
+        self._waits = 0
 
     async def put_result(self, id: str, value: str):
-        # https://github.com/redis/redis-py/issues/2897
-        return await self.redis.rpush(self._redis_key(id), value)  # type: ignore
+        key = self._redis_key(id)
+        async with self.redis.pipeline() as pipe:
+            pipe.rpush(key, value)
+            pipe.expire(key, self.result_ttl)
+            await pipe.execute()
+
+    @contextmanager
+    def reserve_wait(self):
+        """
+        Reserves a wait for the duration of the context, raises `TaskChannelFull` if
+        `max_waits` requests are already waiting.
+        """
+        if self._waits >= self.max_waits:
+            raise TaskChannelFull()
+        self._waits += 1
+        try:
+            yield
+        finally:
+            self._waits -= 1
+
+    async def wait_for_result(self, id, timeout: float) -> Optional[str]:
+        """
+        Returns the result or `None` if it did not arrive within `timeout` seconds.
+        Must be called with a wait reserved by `reserve_wait`.
+        """
+        key = self._redis_key(id)
+        with waiting_for_result_gauge.track_inprogress():
+            # https://github.com/redis/redis-py/issues/2897
+            result = await self.redis.blpop([key], timeout=timeout)  # type: ignore
 
-    async def wait_for_result(self, id) -> str:
-        # https://github.com/redis/redis-py/issues/2897
-        return (await self.redis.blpop(self._redis_key(id)))[1]  # type: ignore
+        if result is None:
+            return None
+        return result[1]
 
     def _redis_key(self, id):
         return self.prefix + id
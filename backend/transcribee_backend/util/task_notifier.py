@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from redis import Redis as SyncRedis
+from redis.asyncio import Redis
+
+
+class TaskReadyNotifier:
+    """
+    Wakes up claim requests that are waiting for a task to become ready.
+
+    `notify` may be called from any thread, e.g. from sync endpoints running in the
+    threadpool.
+    """
+
+    def __init__(self):
+        self._waiters: set[asyncio.Event] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @contextmanager
+    def listen(self) -> Iterator[asyncio.Event]:
+        self._loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        self._waiters.add(event)
+        try:
+            yield event
+        finally:
+            self._waiters.discard(event)
+
+    def notify(self):
+        self._notify_local()
+
+    def _notify_local(self):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._wake_waiters)
+
+    def _wake_waiters(self):
+        for event in self._waiters:
+            event.set()
+
+
+class RedisTaskReadyNotifier(TaskReadyNotifier):
+    """
+    Also wakes up claim requests in other backend processes via redis pub/sub.
+    """
+
+    redis: Redis
+    channel: str
+
+    def __init__(self, redis: Redis, sync_redis: SyncRedis, channel="task-ready"):
+        super().__init__()
+        self.redis = redis
+        self.sync_redis = sync_redis
+        self.channel = channel
+        self._reader: Optional[asyncio.Task] = None
+
+    @contextmanager
+    def listen(self) -> Iterator[asyncio.Event]:
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_messages())
+        with super().listen() as event:
+            yield event
+
+    def notify(self):
+        self._notify_local()
+        try:
+            self.sync_redis.publish(self.channel, b"")
+        except Exception as exc:
+            logging.warning("Publishing task notification failed", exc_info=exc)
+
+    async def _read_messages(self):
+        while True:
+            try:
+                async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    while True:
+                        message = await pubsub.get_message(timeout=1.0)
+                        if message is not None:
+                            self._wake_waiters()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logging.error("Reading task notifications failed", exc_info=exc)
+                await asyncio.sleep(1)
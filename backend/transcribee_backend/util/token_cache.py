@@ -0,0 +1,68 @@
+import hashlib
+import hmac
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+
+class UserTokenCache:
+    """
+    Remembers which `UserToken` a presented token was verified against, so that
+    authenticated requests skip the scrypt comparisons.
+
+    Presented tokens are only stored as their HMAC under `secret_key`. Entries expire
+    after `ttl` seconds and at most `max_entries` are kept, the least recently used
+    ones are evicted first. The cache is local to the process, so callers must still
+    check that the cached token exists in the database and has not expired.
+    """
+
+    def __init__(self, secret_key: str, max_entries: int, ttl: float):
+        self.secret_key = secret_key.encode()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires at, token id, user id)
+        self._entries: OrderedDict[bytes, tuple[float, uuid.UUID, uuid.UUID]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[uuid.UUID]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, token_id, _ = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return token_id
+
+    def put(self, token: str, token_id: uuid.UUID, user_id: uuid.UUID):
+        if self.max_entries <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, token_id, user_id)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_tokens(self, token_ids: Iterable[uuid.UUID]):
+        token_ids = set(token_ids)
+        with self._lock:
+            for key, (_, token_id, _) in list(self._entries.items()):
+                if token_id in token_ids:
+                    del self._entries[key]
+
+    def invalidate_user(self, user_id: uuid.UUID):
+        with self._lock:
+            for key, (_, _, entry_user_id) in list(self._entries.items()):
+                if entry_user_id == user_id:
+                    del self._entries[key]
+
+    def _key(self, token: str) -> bytes:
+        return hmac.new(self.secret_key, token.encode(), hashlib.sha256).digest()
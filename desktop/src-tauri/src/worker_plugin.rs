@@ -77,6 +77,9 @@ fn setup_worker<R: Runtime>(
                             .iter()
                             .map(TaskType::as_worker_arg)
                             .collect::<String>(),
+                        // the worker adapter does not implement long polling
+                        "--claim-wait",
+                        "0",
                     ])
                     .current_dir("../../worker")
             } else {
@@ -90,6 +93,9 @@ fn setup_worker<R: Runtime>(
                         .iter()
                         .map(TaskType::as_worker_arg)
                         .collect::<String>(),
+                    // the worker adapter does not implement long polling
+                    "--claim-wait",
+                    "0",
                 ])
             };
             let (mut events, child) = builder
@@ -76,7 +76,14 @@ export interface paths {
     post: operations["create_task_api_v1_tasks__post"];
   };
   "/api/v1/tasks/claim_unassigned_task/": {
-    /** Claim Unassigned Task */
+    /**
+     * Claim Unassigned Task
+     * @description Claims a ready task of one of the given types.
+     *
+     * If no task is ready, the request is held for up to `wait` seconds until a task
+     * becomes ready (long polling). Longer waits are shortened to the maximum wait
+     * configured on the server.
+     */
     post: operations["claim_unassigned_task_api_v1_tasks_claim_unassigned_task__post"];
   };
   "/api/v1/tasks/queue_info/": {
@@ -1095,10 +1102,19 @@ export interface operations {
     };
   };
   /** Claim Unassigned Task */
+  /**
+   * Claim Unassigned Task
+   * @description Claims a ready task of one of the given types.
+   *
+   * If no task is ready, the request is held for up to `wait` seconds until a task
+   * becomes ready (long polling). Longer waits are shortened to the maximum wait
+   * configured on the server.
+   */
   claim_unassigned_task_api_v1_tasks_claim_unassigned_task__post: {
     parameters: {
       query: {
         task_type: components["schemas"]["TaskType"][];
+        wait?: number;
       };
       header: {
         authorization: string;
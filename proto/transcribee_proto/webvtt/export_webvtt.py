@@ -1,6 +1,8 @@
 import enum
 import re
 import sys
+from bisect import bisect_left
+from itertools import accumulate
 from math import ceil
 from pathlib import Path
 from typing import Mapping
@@ -74,57 +76,94 @@ def format_speaker(name, format: VoiceFormat):
 # is performed and two parts are returned
 # this finds the way to split the list of atoms into parts that are as similar in length as possible
 # (without breaking up the atoms itself)
+#
+# every line ends either just before or just after the first atom with which it reaches
+# the target length. Instead of enumerating all 2^num_splits combinations of these,
+# we only keep the best combination for every start of the next line and total length
+# of the lines so far: for a fixed total length, the variance only depends on the sum
+# of the squared line lengths. Ties are resolved in favor of the combination that
+# comes first in the enumeration order, i.e. with the earlier line ends.
 def reflow_text(atoms, num_splits):
-    def atoms_text_length(atoms):
-        return len("".join(a.text for a in atoms))
-
-    atom_length = atoms_text_length(atoms)
-
-    target_length = int(ceil(atom_length / (num_splits + 1)))
-
-    def split(atoms, num_splits):
-        if num_splits == 0:
-            yield [atoms]
-            return
-
-        partial_split = []
-
-        for i, atom in enumerate(atoms):
-            old_split = partial_split.copy()
-
-            partial_split.append(atom)
-
-            if atoms_text_length(partial_split) >= target_length:
-                for sub_split in split(atoms[i:], num_splits - 1):
-                    yield [old_split] + sub_split
-
-                for sub_split in split(atoms[i + 1 :], num_splits - 1):
-                    yield [partial_split] + sub_split
-
-                break
-
-    splits = list(split(atoms, num_splits))
-    text_splits = []
-    for canidate in splits:
-        lines = []
-        for line in canidate:
-            lines.append("".join(a.text for a in line).strip())
-
-        text_splits.append(lines)
-
-    def score_canidate(canidate):
-        mean_length = sum(len(line) for line in canidate) / len(canidate)
-        error = 0
-        for line in canidate:
-            error += (len(line) - mean_length) ** 2
-
-        return error
-
-    scores = [score_canidate(c) for c in text_splits]
-
-    best = scores.index(min(scores))
+    texts = [a.text for a in atoms]
+    prefix_lengths = [0, *accumulate(len(text) for text in texts)]
+
+    target_length = int(ceil(prefix_lengths[-1] / (num_splits + 1)))
+
+    # the length of a line is computed from the whitespace at the beginning and end of
+    # the atoms, skipping over atoms that consist only of whitespace
+    leading_whitespace = [len(text) - len(text.lstrip()) for text in texts]
+    trailing_whitespace = [len(text) - len(text.rstrip()) for text in texts]
+    # index of the first atom at or after i / the last atom before i with content
+    next_content = [len(atoms)] * (len(atoms) + 1)
+    for i in reversed(range(len(atoms))):
+        next_content[i] = i if texts[i].strip() else next_content[i + 1]
+    previous_content = [-1] * (len(atoms) + 1)
+    for i in range(len(atoms)):
+        previous_content[i + 1] = i if texts[i].strip() else previous_content[i]
+
+    def line_length(start, end):
+        first, last = next_content[start], previous_content[end]
+        if first >= end:
+            return 0
+        return (
+            prefix_lengths[last + 1]
+            - trailing_whitespace[last]
+            - prefix_lengths[first]
+            - leading_whitespace[first]
+        )
 
-    return splits[best], text_splits[best]
+    # combinations of the lines so far, sorted in enumeration order: (order, start of
+    # the next line, total length of the lines, sum of the squared line lengths, line
+    # ends). The line ends are a linked list (end, previous ends), so that extending
+    # them does not copy
+    states = [(0, 0, 0, 0, None)]
+    for _ in range(num_splits):
+        # (start of the next line, total length) -> best combination
+        best_states = {}
+        for position, (_, start, total, squares, ends) in enumerate(states):
+            # index after the first atom with which the line reaches the target length
+            reached = bisect_left(
+                prefix_lengths, prefix_lengths[start] + target_length, lo=start + 1
+            )
+            if reached > len(atoms):
+                continue
+            for choice, end in enumerate((reached - 1, reached)):
+                length = line_length(start, end)
+                key = (end, total + length)
+                # candidates are visited in enumeration order, so on ties the one
+                # already there wins
+                if key not in best_states or squares + length**2 < best_states[key][3]:
+                    best_states[key] = (
+                        2 * position + choice,
+                        end,
+                        total + length,
+                        squares + length**2,
+                        (end, ends),
+                    )
+        states = sorted(best_states.values())
+
+    if not states:
+        raise ValueError(f"atoms cannot be split into {num_splits + 1} lines")
+
+    # the variance of the line lengths, multiplied by the number of lines squared
+    best_score = None
+    for _, start, total, squares, line_ends in states:
+        length = line_length(start, len(atoms))
+        score = (num_splits + 1) * (squares + length**2) - (total + length) ** 2
+        if best_score is None or score < best_score:
+            best_score, ends = score, line_ends
+
+    bounds = [len(atoms)]
+    while ends is not None:
+        end, ends = ends
+        bounds.append(end)
+    bounds.append(0)
+    bounds.reverse()
+
+    splits = [atoms[start:end] for start, end in zip(bounds, bounds[1:])]
+    text_splits = ["".join(a.text for a in line).strip() for line in splits]
+
+    return splits, text_splits
 
 
 # splits multi word atoms into atoms of subwords
@@ -0,0 +1,63 @@
+from email.parser import BytesParser
+from email.policy import HTTP
+from pathlib import Path
+from types import SimpleNamespace
+
+from transcribee_worker.api_client import ApiClient, MultipartFileUpload
+from transcribee_worker.config import settings
+
+
+def test_multipart_file_upload(tmp_path: Path):
+    content = bytes(range(256)) * 1000
+    path = tmp_path / "media.mp3"
+    path.write_bytes(content)
+    progress = []
+
+    with open(path, "rb") as f:
+        body = MultipartFileUpload(
+            [("tags", "profile:mp3"), ("tags", "video")],
+            file_field="file",
+            file=f,
+            filename=path.name,
+            progress_callback=lambda loaded, total: progress.append((loaded, total)),
+        )
+        chunks = []
+        while chunk := body.read(8192):
+            chunks.append(chunk)
+    data = b"".join(chunks)
+
+    assert len(data) == len(body)
+    assert progress[-1] == (len(content), len(content))
+
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {body.content_type}\r\n\r\n".encode() + data
+    )
+    parts = list(message.iter_parts())
+    assert [part.get_param("name", header="content-disposition") for part in parts] == [
+        "tags",
+        "tags",
+        "file",
+    ]
+    assert parts[0].get_payload(decode=True) == b"profile:mp3"
+    assert parts[1].get_payload(decode=True) == b"video"
+    assert parts[2].get_filename() == "media.mp3"
+    assert parts[2].get_payload(decode=True) == content
+
+
+def test_upload_timeout(tmp_path: Path, monkeypatch):
+    path = tmp_path / "media.mp3"
+    path.write_bytes(b"0" * 1000)
+    monkeypatch.setattr(settings, "API_READ_TIMEOUT", 60)
+    monkeypatch.setattr(settings, "API_UPLOAD_STORE_RATE", 100)
+    client = ApiClient("http://localhost/", "ws://localhost/", "token")
+    timeouts = []
+
+    def post(url, timeout, **kwargs):
+        timeouts.append(timeout)
+        return SimpleNamespace(raise_for_status=lambda: None)
+
+    monkeypatch.setattr(client.session, "post", post)
+    client.upload("media/", path, fields=[])
+
+    # reading the response is bounded, allowing time to store the file
+    assert timeouts == [(settings.API_CONNECT_TIMEOUT, 70)]
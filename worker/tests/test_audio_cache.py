@@ -0,0 +1,47 @@
+import os
+from pathlib import Path
+
+import numpy as np
+from transcribee_worker.audio_cache import AudioCache
+
+
+def test_audio_cache_roundtrip(tmp_path: Path):
+    cache = AudioCache(tmp_path, max_bytes=1024 * 1024)
+    audio = np.linspace(-1, 1, 1000, dtype=np.float32)
+
+    assert cache.get("media/a") is None
+    cache.put("media/a", audio)
+    cached = cache.get("media/a")
+    assert cached is not None
+    assert cached.dtype == np.float32
+    assert np.array_equal(cached, audio)
+
+
+def test_audio_cache_evicts_least_recently_used(tmp_path: Path):
+    audio = np.zeros(1000, dtype=np.float32)
+    cache = AudioCache(tmp_path, max_bytes=int(2.5 * audio.nbytes))
+
+    for i, key in enumerate(["a", "b"]):
+        cache.put(key, audio)
+        # make sure the modification times differ
+        os.utime(cache._path(key), (i, i))
+    assert cache.get("a") is not None  # "a" is now more recently used than "b"
+    cache.put("c", audio)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_audio_cache_disabled(tmp_path: Path):
+    cache = AudioCache(tmp_path, max_bytes=0)
+    cache.put("a", np.zeros(10, dtype=np.float32))
+    assert cache.get("a") is None
+
+
+def test_audio_cache_ignores_write_errors(tmp_path: Path):
+    # the cache directory can not be created, because a file is in its place
+    (tmp_path / "cache").touch()
+    cache = AudioCache(tmp_path / "cache", max_bytes=1024 * 1024)
+    cache.put("a", np.zeros(10, dtype=np.float32))
+    assert cache.get("a") is None
@@ -0,0 +1,83 @@
+from math import ceil
+
+import pytest
+from transcribee_proto.document import Atom, Document, Paragraph
+from transcribee_proto.webvtt.export_webvtt import generate_web_vtt, reflow_text
+
+
+def make_atoms(words: list[str]) -> list[Atom]:
+    return [
+        Atom(text=f" {word}", start=i, end=i + 1, conf=1, conf_ts=1)
+        for i, word in enumerate(words)
+    ]
+
+
+def test_reflow_text():
+    atoms = make_atoms("the quick brown fox jumps over the lazy dog".split())
+
+    splits, lines = reflow_text(atoms, 1)
+    assert lines == ["the quick brown fox", "jumps over the lazy dog"]
+    assert [len(split) for split in splits] == [4, 5]
+
+    _, lines = reflow_text(atoms, 2)
+    assert lines == ["the quick brown", "fox jumps over", "the lazy dog"]
+
+    _, lines = reflow_text(atoms, 0)
+    assert lines == ["the quick brown fox jumps over the lazy dog"]
+
+
+def reflow_text_exhaustive(atoms, num_splits):
+    # enumerates all combinations of line ends, each line ending just before or just
+    # after the first atom with which it reaches the target length
+    target_length = ceil(len("".join(a.text for a in atoms)) / (num_splits + 1))
+
+    def split(atoms, num_splits):
+        if num_splits == 0:
+            yield [atoms]
+            return
+        for i in range(len(atoms)):
+            if len("".join(a.text for a in atoms[: i + 1])) >= target_length:
+                for sub_split in split(atoms[i:], num_splits - 1):
+                    yield [atoms[:i]] + sub_split
+                for sub_split in split(atoms[i + 1 :], num_splits - 1):
+                    yield [atoms[: i + 1]] + sub_split
+                return
+
+    def score(lines):
+        lengths = [len(line) for line in lines]
+        return len(lengths) * sum(x**2 for x in lengths) - sum(lengths) ** 2
+
+    candidates = [
+        ["".join(a.text for a in line).strip() for line in candidate]
+        for candidate in split(atoms, num_splits)
+    ]
+    return min(candidates, key=score)
+
+
+@pytest.mark.parametrize("num_splits", [1, 2, 3, 5, 8])
+def test_reflow_text_finds_best_combination(num_splits: int):
+    words = [
+        "a" * (1 + (i * 7) % 11) if i % 5 else "  " if i % 2 else "" for i in range(60)
+    ]
+    for num_atoms in range(2 * num_splits + 2, len(words)):
+        atoms = make_atoms(words[:num_atoms])
+        _, lines = reflow_text(atoms, num_splits)
+        assert lines == reflow_text_exhaustive(atoms, num_splits)
+
+
+def test_generate_web_vtt_long_paragraph():
+    # paragraphs this long are split into hundreds of cues
+    words = [f"word{i % 100}" for i in range(5000)]
+    doc = Document(
+        speaker_names={},
+        children=[Paragraph(children=make_atoms(words), lang="en")],
+    )
+
+    vtt = generate_web_vtt(doc, True, False, 42).to_string()
+
+    cues = vtt.split("\n\n")[1:]
+    assert len(cues) > 100
+    cue_words = [
+        word for cue in cues for line in cue.splitlines()[1:] for word in line.split()
+    ]
+    assert cue_words == ["Unknown:", *words]
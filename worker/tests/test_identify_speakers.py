@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+from transcribee_proto.document import Atom, Document, Paragraph
+from transcribee_worker import identify_speakers as identify_speakers_module
+from transcribee_worker.config import settings
+from transcribee_worker.identify_speakers import identify_speakers
+
+
+class FakeClusterer:
+    def __init__(self, **kwargs):
+        pass
+
+    def predict(self, embeddings):
+        return [0] * len(embeddings)
+
+
+def test_identify_speakers_keeps_paragraph_order(monkeypatch):
+    monkeypatch.setattr(settings, "SPEAKER_EMBEDDING_BATCH_SIZE", 2)
+    monkeypatch.setattr(identify_speakers_module, "get_classifier", lambda: None)
+    monkeypatch.setattr(identify_speakers_module, "SpectralClusterer", FakeClusterer)
+    # the embedding of a segment is its length
+    monkeypatch.setattr(
+        identify_speakers_module,
+        "embed_batch",
+        lambda classifier, wavs: [np.array([len(wav)]) for wav in wavs],
+    )
+
+    durations = [3.0, 1.0, 4.0, 1.5, 0.5]
+    children = []
+    start = 0.0
+    for duration in durations:
+        atom = Atom(text="a", start=start, end=start + duration, conf=1, conf_ts=1)
+        children.append(Paragraph(children=[atom], lang="en"))
+        start += duration
+    doc = Document(children=children, speaker_names={})
+    audio = np.zeros(int(start * settings.SAMPLE_RATE), dtype=np.float32)
+
+    embeddings = asyncio.run(
+        identify_speakers(None, audio, doc, lambda *args, **kwargs: None)
+    )
+
+    assert [int(embedding[0]) for embedding in embeddings] == [
+        int(duration * settings.SAMPLE_RATE) for duration in durations
+    ]
@@ -0,0 +1,50 @@
+from transcribee_worker.model_cache import ModelCache
+
+
+def test_model_cache_reuses_loaded_models():
+    cache = ModelCache(max_bytes=100)
+    loads = []
+
+    def load(name):
+        def _load():
+            loads.append(name)
+            return name, 10
+
+        return _load
+
+    assert cache.get("a", load("a")) == "a"
+    assert cache.get("a", load("a")) == "a"
+    assert loads == ["a"]
+
+
+def test_model_cache_evicts_least_recently_used():
+    cache = ModelCache(max_bytes=100)
+    loads = []
+
+    def load(name):
+        def _load():
+            loads.append(name)
+            return name, 40
+
+        return _load
+
+    cache.get("a", load("a"))
+    cache.get("b", load("b"))
+    cache.get("a", load("a"))
+    cache.get("c", load("c"))  # over budget, evicts "b"
+    cache.get("a", load("a"))
+    cache.get("b", load("b"))
+    assert loads == ["a", "b", "c", "b"]
+
+
+def test_model_cache_keeps_oversized_model():
+    cache = ModelCache(max_bytes=10)
+    loads = []
+
+    def load():
+        loads.append("big")
+        return "big", 1000
+
+    cache.get("big", load)
+    cache.get("big", load)
+    assert loads == ["big"]
@@ -0,0 +1,84 @@
+import asyncio
+import uuid
+from pathlib import Path
+
+from transcribee_proto.api import Document, LocalDocumentMedia, TaskType
+from transcribee_worker import worker as worker_module
+from transcribee_worker.audio_cache import AudioCache
+from transcribee_worker.config import settings
+from transcribee_worker.worker import Worker
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def test_prefetch_document_audio(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(settings, "WORKER_TYPE", "desktop")
+    worker = Worker("http://localhost", "ws://localhost", "token", prefetch=True)
+    worker.audio_cache = AudioCache(tmp_path, max_bytes=1024 * 1024 * 1024)
+    mf = LocalDocumentMedia(tags=[], path=str(DATA_DIR / "sample.mp3"))
+    document = Document(
+        id=uuid.uuid4(),
+        name="test",
+        created_at="",
+        changed_at="",
+        media_files=[mf],
+    )
+
+    worker.prefetch_document_audio(document)
+
+    cache_key = worker.get_audio_cache_key(mf)
+    assert cache_key is not None
+    cached = worker.audio_cache.get(cache_key)
+    assert cached is not None and len(cached) > 0
+    assert (worker.load_document_audio(document) == cached).all()
+
+
+def test_prefetch_only_during_work(monkeypatch):
+    monkeypatch.setattr(worker_module, "PROGRESS_CHECK_INTERVAL", 0)
+    worker = Worker("http://localhost", "ws://localhost", "token", prefetch=True)
+    # every progress change is sent with a keepalive, once the worker has checked it
+    sent_progress = []
+
+    def keepalive(*args):
+        sent_progress.append(worker._result_data["progress"][-1])
+        return True
+
+    monkeypatch.setattr(worker, "keepalive", keepalive)
+    prefetched = []
+
+    async def prefetch_next_task():
+        prefetched.append(worker._result_data["progress"][-1]["step"])
+
+    monkeypatch.setattr(worker, "prefetch_next_task", prefetch_next_task)
+
+    async def run(steps: list[tuple[str, float]]):
+        worker._result_data = {"progress": []}
+        worker._set_progress("initial", 0.0)
+        worker._prefetched_task = None
+
+        async def perform_task():
+            for step, progress in steps:
+                worker._set_progress(step, progress)
+                current = worker._result_data["progress"][-1]
+                while not sent_progress or sent_progress[-1] is not current:
+                    await asyncio.sleep(0)
+
+        task = asyncio.create_task(perform_task())
+        await worker.keep_alive_while_running(uuid.uuid4(), task)
+        if worker._prefetched_task is not None:
+            await worker._prefetched_task
+
+    # the final step of every task does not trigger prefetching
+    asyncio.run(run([(f"{TaskType.EXPORT}:done", 1.0)]))
+    asyncio.run(run([(f"{TaskType.TRANSCRIBE}:done", 1.0)]))
+    assert prefetched == []
+
+    asyncio.run(
+        run(
+            [
+                (f"{TaskType.TRANSCRIBE}:transcribe", 0.5),
+                (f"{TaskType.TRANSCRIBE}:transcribe", 0.9),
+            ]
+        )
+    )
+    assert prefetched == [f"{TaskType.TRANSCRIBE}:transcribe"]
@@ -1,4 +1,5 @@
 import logging
+from fractions import Fraction
 from pathlib import Path
 
 import av.logging
@@ -6,11 +7,15 @@ import numpy as np
 from av.datasets import fate as fate_suite
 from transcribee_worker.config import settings
 from transcribee_worker.reencode import (
+    _choose_segment_starts,
     calculate_new_dimensions,
     get_duration,
     get_video_stream,
+    iter_audio,
     load_audio,
     reencode,
+    reencode_multi,
+    reencode_segmented,
 )
 
 
@@ -20,6 +25,14 @@ def test_load_audio():
     assert 0.2 < np.max(audio) < 1.0
 
 
+def test_iter_audio():
+    audio = load_audio(fate_suite("aac/Fd_2_c1_Ms_0x01.mp4"))
+    chunks = list(iter_audio(fate_suite("aac/Fd_2_c1_Ms_0x01.mp4"), chunk_size=16000))
+    assert all(len(chunk) == 16000 for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= 16000
+    assert np.array_equal(np.concatenate(chunks), audio)
+
+
 def test_get_duration():
     duration = get_duration(Path(fate_suite("aac/Fd_2_c1_Ms_0x01.mp4")))
     assert duration == 30.000023
@@ -68,3 +81,63 @@ def test_reencode_video(tmp_path: Path):
         str(tmp_path / "test.mp4"),
         output_params=settings.REENCODE_PROFILES["video:mp4"],
     )
+
+
+def test_reencode_multi(tmp_path: Path):
+    reencode_multi(
+        fate_suite("mkv/test7_cut.mkv"),
+        [
+            (str(tmp_path / "test.mp3"), settings.REENCODE_PROFILES["mp3"]),
+            (str(tmp_path / "test.mp4"), settings.REENCODE_PROFILES["video:mp4"]),
+        ],
+    )
+
+    assert get_video_stream(tmp_path / "test.mp3") is None
+    assert get_video_stream(tmp_path / "test.mp4") is not None
+
+
+def test_choose_segment_starts(monkeypatch):
+    monkeypatch.setattr(settings, "REENCODE_MIN_SEGMENT_DURATION", 10)
+    keyframes = list(range(0, 100, 2))
+
+    starts = _choose_segment_starts(keyframes, Fraction(1), 100, segments=4)
+    assert starts == [0, 26, 52, 78]
+
+    # segments are not made shorter than the minimum segment duration
+    starts = _choose_segment_starts(keyframes, Fraction(1), 100, segments=100)
+    assert starts == list(range(0, 100, 10))
+
+
+def video_frame_times(path: Path | str) -> tuple[list[float], float]:
+    """
+    Returns the presentation times of all video frames and the duration of a frame.
+    """
+    with av.open(str(path)) as container:
+        stream = container.streams.video[0]
+        times = sorted(frame.time for frame in container.decode(stream))
+        return times, 1 / float(stream.average_rate)
+
+
+def test_reencode_segmented(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(settings, "REENCODE_MIN_SEGMENT_DURATION", 0)
+    progress = []
+
+    reencode_segmented(
+        fate_suite("mkv/test7_cut.mkv"),
+        str(tmp_path / "test.mp4"),
+        output_params=settings.REENCODE_PROFILES["video:mp4"],
+        progress_callback=lambda progress, **kwargs: progress.append(progress),
+        segments=4,
+    )
+
+    assert get_video_stream(tmp_path / "test.mp4") is not None
+    assert 0 < progress[-1] <= 1.0
+
+    # no frames are dropped or duplicated at the segment boundaries
+    source_times, frame_duration = video_frame_times(fate_suite("mkv/test7_cut.mkv"))
+    output_times, _ = video_frame_times(tmp_path / "test.mp4")
+    assert abs(len(output_times) - len(source_times)) <= 1
+    assert (
+        abs((output_times[-1] - output_times[0]) - (source_times[-1] - source_times[0]))
+        <= frame_duration
+    )
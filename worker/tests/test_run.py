@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+from transcribee_worker import run
+
+
+class NoWorkWorker:
+    has_prefetched_task = False
+
+    def __init__(self, finish_event: asyncio.Event, claims: int, held: float, clock):
+        self.finish_event = finish_event
+        self.claims = claims
+        self.held = held
+        self.clock = clock
+
+    async def run_task(self, mark_completed: bool):
+        self.clock.now += self.held
+        self.claims -= 1
+        if self.claims == 0:
+            self.finish_event.set()
+        return True
+
+
+def run_no_work_worker(monkeypatch, claim_wait: float, held: float) -> list[float]:
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(run.time, "monotonic", lambda: clock.now)
+    backoffs = []
+
+    async def wait_for_event(event, timeout):
+        backoffs.append(timeout)
+
+    monkeypatch.setattr(run, "wait_for_event", wait_for_event)
+
+    finish_event = asyncio.Event()
+    worker = NoWorkWorker(finish_event, claims=3, held=held, clock=clock)
+    args = SimpleNamespace(claim_wait=claim_wait, run_once_and_dont_complete=False)
+    asyncio.run(run.run_worker(worker, args, finish_event))
+    return backoffs
+
+
+def test_run_worker_backs_off_when_claim_returns_early(monkeypatch):
+    # e.g. a backend that limits the wait to 0 or ignores it
+    assert run_no_work_worker(monkeypatch, claim_wait=30, held=0) == [5, 5, 5]
+    assert run_no_work_worker(monkeypatch, claim_wait=0, held=0) == [5, 5, 5]
+
+
+def test_run_worker_long_polls_without_backoff(monkeypatch):
+    assert run_no_work_worker(monkeypatch, claim_wait=30, held=30) == []
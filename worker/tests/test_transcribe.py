@@ -5,7 +5,11 @@ from typing import List
 import pytest
 from pydantic import BaseModel
 from transcribee_proto.document import Atom, Paragraph
+from transcribee_worker import whisper_transcribe
+from transcribee_worker.config import settings
 from transcribee_worker.whisper_transcribe import (
+    choose_chunks,
+    get_transcribe_workers,
     move_space_to_prev_token,
     strict_sentence_paragraphs,
 )
@@ -65,6 +69,60 @@ def test_strict_sentence_paragraphs_dont_combine_overly_long_paras():
     assert output == test_data
 
 
+def test_strict_sentence_paragraphs_scanned_text(monkeypatch):
+    # a synthetic transcript of 10k whisper segments, where sentences span several
+    # segments
+    test_data = [
+        Paragraph(
+            lang="en",
+            children=[
+                Atom(text=f" {word}", start=0, end=0, conf=1, conf_ts=0)
+                for word in (
+                    f"and this is part {i} of a sentence".split()
+                    if i % 15
+                    else f"which ends here, e.g. in segment {i}. And".split()
+                )
+            ],
+        )
+        for i in range(10_000)
+    ]
+
+    created = []
+    break_iterator = whisper_transcribe.BreakIterator
+
+    class CountingBreakIterator:
+        DONE = break_iterator.DONE
+
+        @staticmethod
+        def createSentenceInstance(locale):
+            created.append(locale)
+            return break_iterator.createSentenceInstance(locale)
+
+    scanned = []
+    sentence_breaks = whisper_transcribe._sentence_breaks
+
+    def counting_sentence_breaks(iterator, text, start):
+        scanned.append(len(text))
+        return sentence_breaks(iterator, text, start)
+
+    monkeypatch.setattr(whisper_transcribe, "BreakIterator", CountingBreakIterator)
+    monkeypatch.setattr(
+        whisper_transcribe, "_sentence_breaks", counting_sentence_breaks
+    )
+
+    output = list(strict_sentence_paragraphs(iter(test_data)))
+
+    assert "".join(x.text() for x in output) == "".join(x.text() for x in test_data)
+    # the sentence rules are only loaded once per language and every segment is only
+    # scanned together with the unfinished sentence before it (of at most 161 atoms
+    # before the raw segments are emitted), so the text scanned per segment does not
+    # grow with the length of the transcript
+    assert len(created) == 1
+    most_atoms = max(len(x.children) for x in test_data)
+    longest_atom = max(len(atom.text) for x in test_data for atom in x.children)
+    assert max(scanned) <= (162 + most_atoms) * longest_atom
+
+
 @pytest.mark.parametrize(
     "data_file",
     glob.glob(
@@ -93,3 +151,35 @@ def test_space_and_sentences(data_file):
     for p in output:
         print(p.model_dump_json())
     assert output == test_data.expected
+
+
+def test_choose_chunks():
+    speech = [
+        {"start": 0, "end": 40},
+        {"start": 60, "end": 90},
+        {"start": 100, "end": 250},
+        {"start": 270, "end": 300},
+    ]
+    # cut at the last silence that fits, split speech if there is none
+    assert choose_chunks(speech, 300, 100) == [
+        (0, 95),
+        (95, 195),
+        (195, 260),
+        (260, 300),
+    ]
+    assert choose_chunks(speech, 300, 300) == [(0, 300)]
+    assert choose_chunks([], 250, 100) == [(0, 100), (100, 200), (200, 250)]
+
+
+def test_get_transcribe_workers(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    monkeypatch.setattr(settings, "WHISPER_MODEL_CACHE_SIZE", 1000)
+
+    monkeypatch.setattr(settings, "TRANSCRIBE_WORKERS", 3)
+    assert get_transcribe_workers(model_size=600) == 3
+
+    # by default, only as many model replicas as fit into the cache are loaded
+    monkeypatch.setattr(settings, "TRANSCRIBE_WORKERS", 0)
+    assert get_transcribe_workers(model_size=100) == 8
+    assert get_transcribe_workers(model_size=300) == 3
+    assert get_transcribe_workers(model_size=2000) == 1
@@ -0,0 +1,22 @@
+import asyncio
+
+from transcribee_worker.util import abatch, alist
+
+
+async def produce(delays: list[float]):
+    for i, delay in enumerate(delays):
+        await asyncio.sleep(delay)
+        yield i
+
+
+def test_abatch_max_size():
+    batches = asyncio.run(alist(abatch(produce([0] * 7), max_size=3, max_delay=10)))
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_abatch_max_delay():
+    # the first batch is emitted while waiting for the slow item
+    batches = asyncio.run(
+        alist(abatch(produce([0, 0, 0.5, 0]), max_size=10, max_delay=0.1))
+    )
+    assert batches == [[0, 1], [2, 3]]
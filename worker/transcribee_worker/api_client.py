@@ -1,29 +1,134 @@
 #!/usr/bin/env python3
 
+import logging
+import os
+import time
 import urllib.parse
+import uuid
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from pathlib import Path
+from typing import AsyncGenerator, BinaryIO, Callable, Optional
 from uuid import UUID
 
 import requests
+from requests.adapters import HTTPAdapter
+from transcribee_worker.config import settings
 from transcribee_worker.document import SyncedDocument
+from urllib3.util.retry import Retry
 from websockets.legacy.client import connect
 
+# called with the number of bytes transferred so far and the total number of bytes
+# (if known)
+TransferProgressCallback = Callable[[int, Optional[int]], None]
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class MultipartFileUpload:
+    """
+    A multipart/form-data request body consisting of form fields and a single file.
+
+    The file is read in chunks while the request is sent, so it is never loaded into
+    memory as a whole.
+    """
+
+    def __init__(
+        self,
+        fields: list[tuple[str, str]],
+        file_field: str,
+        file: BinaryIO,
+        filename: str,
+        progress_callback: Optional[TransferProgressCallback] = None,
+    ):
+        self.boundary = uuid.uuid4().hex
+        self.file = file
+        self.file_size = os.fstat(file.fileno()).st_size
+        self.progress_callback = progress_callback
+
+        head = b"".join(
+            self._part_header(f'name="{name}"') + value.encode() + b"\r\n"
+            for name, value in fields
+        )
+        head += self._part_header(
+            f'name="{file_field}"; filename="{filename}"',
+            "Content-Type: application/octet-stream\r\n",
+        )
+        tail = f"\r\n--{self.boundary}--\r\n".encode()
+        # `None` stands for the file contents
+        self._parts: list[bytes | None] = [head, None, tail]
+        self._length = len(head) + self.file_size + len(tail)
+
+    def _part_header(self, disposition: str, extra_headers: str = "") -> bytes:
+        return (
+            f"--{self.boundary}\r\n"
+            f"Content-Disposition: form-data; {disposition}\r\n"
+            f"{extra_headers}\r\n"
+        ).encode()
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._parts:
+            part = self._parts[0]
+            if part is None:
+                chunk = self.file.read(size)
+                if not chunk:
+                    self._parts.pop(0)
+                    continue
+                if self.progress_callback is not None:
+                    self.progress_callback(self.file.tell(), self.file_size)
+            else:
+                chunk = part[:size]
+                if len(chunk) == len(part):
+                    self._parts.pop(0)
+                else:
+                    self._parts[0] = part[size:]
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
 
 class ApiClient:
     def __init__(self, base_url: str, websocket_base_url: str, token: str):
         self.base_url = base_url
         self.websocket_base_url = websocket_base_url
         self.token = token
+        self.timeout = (settings.API_CONNECT_TIMEOUT, settings.API_READ_TIMEOUT)
+
+        # requests to the backend reuse pooled connections. Connection errors are
+        # retried for all requests, failed responses only for idempotent ones
+        retry = Retry(
+            total=settings.API_RETRIES,
+            backoff_factor=settings.API_RETRY_BACKOFF,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=settings.API_POOL_SIZE,
+            pool_maxsize=settings.API_POOL_SIZE,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def _get_headers(self):
         return {"authorization": f"Worker {self.token}"}
 
-    def post(self, url, **kwargs):
-        req = requests.post(
+    def post(self, url, extra_headers: Optional[dict[str, str]] = None, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        req = self.session.post(
             self._get_url(url),
             **kwargs,
-            headers=self._get_headers(),
+            headers={**self._get_headers(), **(extra_headers or {})},
         )
         req.raise_for_status()
         return req
@@ -32,10 +137,98 @@ class ApiClient:
         return urllib.parse.urljoin(self.base_url, url)
 
     def get(self, url):
-        req = requests.get(self._get_url(url))
+        req = self.session.get(self._get_url(url), timeout=self.timeout)
         req.raise_for_status()
         return req
 
+    def download(
+        self,
+        url: str,
+        path: Path,
+        progress_callback: Optional[TransferProgressCallback] = None,
+        max_retries: int = 5,
+    ):
+        """
+        Streams the response body to `path`. If the connection breaks, the download is
+        resumed with range requests.
+        """
+        loaded = 0
+        total = None
+        retries = 0
+        with open(path, "wb") as f:
+            while total is None or loaded < total:
+                headers = {"Range": f"bytes={loaded}-"} if loaded > 0 else {}
+                try:
+                    with self.session.get(
+                        self._get_url(url),
+                        headers=headers,
+                        stream=True,
+                        timeout=self.timeout,
+                    ) as req:
+                        req.raise_for_status()
+                        if req.status_code == 206:
+                            total = int(req.headers["Content-Range"].rsplit("/", 1)[1])
+                        else:
+                            # the server ignored the range, start over
+                            f.seek(0)
+                            f.truncate()
+                            loaded = 0
+                            if "Content-Length" in req.headers:
+                                total = int(req.headers["Content-Length"])
+
+                        for chunk in req.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                            loaded += len(chunk)
+                            if progress_callback is not None:
+                                progress_callback(loaded, total)
+
+                        if total is None:
+                            # without a content length, we have to trust that the
+                            # server sent the whole body
+                            total = loaded
+                except (
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                ) as e:
+                    retries += 1
+                    if retries > max_retries:
+                        raise
+                    logging.warning(
+                        f"Download interrupted after {loaded} bytes, resuming: {e}"
+                    )
+                    time.sleep(min(2**retries, 30))
+
+    def upload(
+        self,
+        url: str,
+        path: Path,
+        fields: list[tuple[str, str]],
+        progress_callback: Optional[TransferProgressCallback] = None,
+    ):
+        """
+        Posts the file at `path` as multipart/form-data without loading it into memory.
+        """
+        read_timeout = (
+            settings.API_READ_TIMEOUT
+            + path.stat().st_size / settings.API_UPLOAD_STORE_RATE
+        )
+        with open(path, "rb") as f:
+            body = MultipartFileUpload(
+                fields,
+                file_field="file",
+                file=f,
+                filename=path.name,
+                progress_callback=progress_callback,
+            )
+            return self.post(
+                url,
+                data=body,
+                extra_headers={"Content-Type": body.content_type},
+                # the backend stores the file before responding, which takes time
+                # proportional to its size
+                timeout=(settings.API_CONNECT_TIMEOUT, read_timeout),
+            )
+
     @asynccontextmanager
     async def document(self, id: UUID) -> AsyncGenerator[SyncedDocument, None]:
         params = urllib.parse.urlencode(self._get_headers())
@@ -0,0 +1,88 @@
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+
+class AudioCache:
+    """
+    Caches decoded audio on disk, so that consecutive tasks for the same media skip
+    downloading and decoding it.
+
+    Entries are stored as `.npy` files named after the hash of their key and are memory
+    mapped when loaded. The least recently used entries are deleted once the cache
+    grows beyond `max_bytes`. A budget of 0 disables the cache.
+
+    The cache only ever speeds up tasks: Failures to read, write or evict entries (e.g.
+    a full disk, or an entry that is still memory mapped on windows) are logged and
+    otherwise ignored.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}.npy"
+
+    def get(self, key: str) -> Optional[npt.NDArray[np.float32]]:
+        if self.max_bytes <= 0:
+            return None
+        path = self._path(key)
+        try:
+            audio = np.load(path, mmap_mode="r")
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        logging.debug(f"Using cached audio for {key}")
+        return audio
+
+    def put(self, key: str, audio: npt.NDArray[np.float32]):
+        if self.max_bytes <= 0 or audio.nbytes > self.max_bytes:
+            return
+        try:
+            self._write(key, audio)
+            self._evict()
+        except Exception as exc:
+            logging.warning(f"Caching audio for {key} failed", exc_info=exc)
+
+    def _write(self, key: str, audio: npt.NDArray[np.float32]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first, so that concurrent readers never see
+        # partially written entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, audio)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def _evict(self):
+        entries = []
+        for path in self.directory.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        used_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if used_bytes <= self.max_bytes:
+                break
+            logging.debug(f"Evicting {path} from audio cache")
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as exc:
+                # e.g. the entry is still memory mapped by another task on windows
+                logging.warning(f"Evicting {path} from audio cache failed: {exc}")
+                continue
+            used_bytes -= size
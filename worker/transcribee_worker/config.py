@@ -34,9 +34,30 @@ class OutputProfile:
 class Settings(BaseSettings):
     SAMPLE_RATE: int = 16_000  # samples per second
     MODELS_DIR: Path = Path(__file__).parent / ".data" / "models"
+    AUDIO_CACHE_DIR: Path = Path(__file__).parent / ".data" / "audio_cache"
+    # upper bound for the decoded audio kept on disk between tasks. 0 disables the cache
+    AUDIO_CACHE_SIZE: int = 2 * 1024 * 1024 * 1024  # bytes
+    # progress of the current task after which the next task is claimed and its
+    # audio is prefetched (if enabled)
+    PREFETCH_PROGRESS: float = 0.8
 
     HUGGINGFACE_TOKEN: Optional[str] = None
 
+    WHISPER_COMPUTE_TYPE: str = "default"
+    # upper bound for the on-disk size of the whisper models kept loaded between
+    # tasks, counting one copy per transcribe worker. 0 disables the cache
+    WHISPER_MODEL_CACHE_SIZE: int = 4 * 1024 * 1024 * 1024  # bytes
+    # number of chunks of a recording that are transcribed in parallel. Recordings are
+    # split at silences into chunks of up to TRANSCRIBE_CHUNK_DURATION. 1 transcribes
+    # the whole recording at once, 0 uses one worker per cpu, but no more than the
+    # copies of the model that fit into WHISPER_MODEL_CACHE_SIZE
+    TRANSCRIBE_WORKERS: int = 1
+    TRANSCRIBE_CHUNK_DURATION: float = 300  # seconds
+    # transcribed paragraphs are added to the document in one change once there are
+    # TRANSCRIBE_BATCH_SIZE of them or the oldest is TRANSCRIBE_BATCH_DELAY old
+    TRANSCRIBE_BATCH_SIZE: int = 50
+    TRANSCRIBE_BATCH_DELAY: float = 1  # seconds
+
     REENCODE_PROFILES: Dict[str, OutputProfile] = {
         "mp3": OutputProfile(
             container="mp3",
@@ -86,8 +107,33 @@ class Settings(BaseSettings):
         ),
     }
 
+    # number of processes video reencoding is split across. 1 encodes the video in one
+    # pass together with the audio profiles
+    REENCODE_SEGMENTS: int = 1
+    # segments are not made shorter than this, process startup would dominate otherwise
+    REENCODE_MIN_SEGMENT_DURATION: float = 60  # seconds
+
     WORKER_TYPE: Literal["web", "desktop"] = "web"
 
+    # should match `worker_timeout` of the backend, keepalives are sent often enough
+    # to not be considered dead
+    WORKER_TIMEOUT: float = 60  # seconds
+
+    # connections to the backend
+    API_POOL_SIZE: int = 10
+    API_RETRIES: int = 3
+    API_RETRY_BACKOFF: float = 0.5  # seconds, doubled for each retry
+    API_CONNECT_TIMEOUT: float = 10  # seconds
+    API_READ_TIMEOUT: float = 60  # seconds
+    # uploads may additionally wait one second for every this many bytes, while the
+    # backend stores them
+    API_UPLOAD_STORE_RATE: float = 10 * 1024 * 1024  # bytes per second
+
+    # number of paragraphs whose speaker embeddings are computed in one forward pass
+    SPEAKER_EMBEDDING_BATCH_SIZE: int = 16
+    # number of threads torch uses for inference, None keeps the torch default
+    TORCH_NUM_THREADS: Optional[int] = None
+
     model_config = SettingsConfigDict(env_file=".env")
 
     def setup_env_vars(self):
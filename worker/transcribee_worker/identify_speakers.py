@@ -1,4 +1,5 @@
 import logging
+import threading
 
 import automerge
 import numpy as np
@@ -34,6 +35,59 @@ icassp2018_refinement_options = RefinementOptions(
     refinement_sequence=ICASSP2018_REFINEMENT_SEQUENCE,
 )
 
+_classifier: EncoderClassifier | None = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> EncoderClassifier:
+    """
+    Returns the speaker embedding model, loading it on the first call.
+
+    The model is shared by all speaker identification tasks of this process.
+    """
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            logging.info("Loading speaker embedding model")
+            classifier = EncoderClassifier.from_hparams(
+                # default symlink strategy is no good on windows
+                local_strategy=LocalStrategy.COPY_SKIP_CACHE,
+                source="speechbrain/spkrec-ecapa-voxceleb",
+                savedir=settings.MODELS_DIR / "speechbrain-spkrec-ecapa-voxceleb",
+            )
+            if classifier is None:
+                raise ValueError("classifier is None")
+            _classifier = classifier
+            if settings.TORCH_NUM_THREADS is not None:
+                torch.set_num_threads(settings.TORCH_NUM_THREADS)
+        return _classifier
+
+
+def enumerate_batches(segments: list[tuple[int, int]]):
+    """
+    Groups segment indices into batches of similar length, so that little padding
+    is needed. Yields the number of segments in previous batches and the batch.
+    """
+    by_length = sorted(
+        range(len(segments)), key=lambda i: segments[i][1] - segments[i][0]
+    )
+    batch_size = max(settings.SPEAKER_EMBEDDING_BATCH_SIZE, 1)
+    for offset in range(0, len(by_length), batch_size):
+        yield offset, by_length[offset : offset + batch_size]
+
+
+def embed_batch(classifier: EncoderClassifier, wavs: list[npt.NDArray]):
+    # empty segments are embedded as a single silent sample
+    max_len = max(max(len(wav) for wav in wavs), 1)
+    padded = np.zeros((len(wavs), max_len), dtype=np.float32)
+    for i, wav in enumerate(wavs):
+        padded[i, : len(wav)] = wav
+    wav_lens = torch.tensor([max(len(wav), 1) / max_len for wav in wavs])
+
+    with torch.no_grad():
+        embeddings = classifier.encode_batch(torch.from_numpy(padded), wav_lens)
+    return [embedding[0].numpy() for embedding in embeddings]
+
 
 async def identify_speakers(
     number_of_speakers: int | None,
@@ -75,25 +129,24 @@ async def identify_speakers(
             for child in doc.children
         ]
 
-        classifier = EncoderClassifier.from_hparams(
-            # default symlink strategy is no good on windows
-            local_strategy=LocalStrategy.COPY_SKIP_CACHE,
-            source="speechbrain/spkrec-ecapa-voxceleb",
-            savedir=settings.MODELS_DIR / "speechbrain-spkrec-ecapa-voxceleb",
-        )
-        if classifier is None:
-            raise ValueError("classifier is None")
+        classifier = get_classifier()
 
-        embeddings = []
-        for i, (start, end) in enumerate(segments):
+        embeddings: list[npt.NDArray] = [np.empty(0)] * len(segments)
+        for done, batch in enumerate_batches(segments):
             progress_callback(
-                step="generating speaker embeddings", progress=i / (len(segments) + 1)
+                step="generating speaker embeddings",
+                progress=done / (len(segments) + 1),
             )
-            wav = audio[start:end]
-            wav_tensor = torch.tensor(wav[np.newaxis, :])
-            embedding = classifier.encode_batch(wav_tensor)
-            embeddings.append(embedding[0, 0].detach().numpy())
-            queue.submit(embedding[0, 0].detach().numpy())
+            batch_embeddings = embed_batch(
+                classifier, [audio[segments[i][0] : segments[i][1]] for i in batch]
+            )
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+
+        # the batches are sorted by length, the embeddings are returned in the order
+        # of the paragraphs
+        for embedding in embeddings:
+            queue.submit(embedding)
 
         progress_callback(
             step="clustering speaker embeddings",
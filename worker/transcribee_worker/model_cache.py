@@ -0,0 +1,52 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class ModelCache(Generic[K, V]):
+    """
+    Keeps loaded models around between tasks.
+
+    Entries are evicted in least-recently-used order once their combined (estimated)
+    size exceeds `max_bytes`. The most recently used model is always kept, even if it
+    alone exceeds the budget. A budget of 0 disables caching.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[K, Tuple[V, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K, load: Callable[[], Tuple[V, int]]) -> V:
+        """
+        Returns the cached model for `key`, calling `load` on a cache miss.
+
+        `load` returns the model together with its estimated size in bytes.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+
+            logging.info(f"Loading model {key}")
+            model, size = load()
+            if self.max_bytes > 0:
+                self._entries[key] = (model, size)
+                self._evict()
+            return model
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _used_bytes(self):
+        return sum(size for _, size in self._entries.values())
+
+    def _evict(self):
+        while len(self._entries) > 1 and self._used_bytes() > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            logging.info(f"Evicting model {key} from cache")
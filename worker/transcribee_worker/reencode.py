@@ -1,15 +1,25 @@
+import heapq
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait
+from dataclasses import replace
+from fractions import Fraction
 from math import pi, sqrt
 from pathlib import Path
+from queue import Queue
+from typing import Iterator
 
 import av
 import numpy as np
 import numpy.typing as npt
-from av import AudioFrame, AudioStream, VideoFrame, VideoStream
+from av import AudioFrame, AudioStream, Packet, VideoFrame, VideoStream
 from av.audio.resampler import AudioResampler
 from av.codec.context import ThreadType
-from av.container import InputContainer
+from av.container import InputContainer, OutputContainer
 from av.filter.graph import Graph
-from transcribee_worker.config import OutputProfile, settings
+from transcribee_worker.config import OutputProfile, VideoOptions, settings
 from transcribee_worker.types import ProgressCallbackType
 
 
@@ -20,21 +30,76 @@ def as_input_container(x: Path | str | InputContainer):
         return av.open(str(x))
 
 
-def load_audio(x: Path | str | InputContainer) -> npt.NDArray[np.float32]:
-    input_file = as_input_container(x)
+def _decode_audio(input_file: InputContainer) -> Iterator[npt.NDArray[np.int16]]:
     input_stream = input_file.streams.audio[0]
     resampler = AudioResampler(format="s16", layout="mono", rate=settings.SAMPLE_RATE)
-    frames = []
     for frame in input_file.decode(input_stream):
         for new_frame in resampler.resample(frame):
-            frames.append(new_frame.to_ndarray()[0])
-    to_return = np.concatenate(frames, dtype=np.float32)
-    to_return /= (
-        2**15
-    )  # we get 16 bit frames from ffmpeg, this normalizes to [-1, +1]
+            yield new_frame.to_ndarray()[0]
+
+
+def _to_float(
+    samples: npt.NDArray[np.int16], out: npt.NDArray[np.float32]
+) -> npt.NDArray[np.float32]:
+    # we get 16 bit frames from ffmpeg, this normalizes to [-1, +1]
+    return np.multiply(samples, np.float32(2**-15), out=out)
+
+
+def load_audio(x: Path | str | InputContainer) -> npt.NDArray[np.float32]:
+    input_file = as_input_container(x)
+
+    # the duration is only an estimate, so we grow the buffer if it turns out too small
+    expected_length = 0
+    if input_file.duration is not None:
+        expected_length = int(input_file.duration / 1e6 * settings.SAMPLE_RATE)
+    to_return = np.empty(max(expected_length, settings.SAMPLE_RATE), dtype=np.float32)
+    length = 0
+    for samples in _decode_audio(input_file):
+        if length + len(samples) > len(to_return):
+            grown = np.empty(
+                max(2 * len(to_return), length + len(samples)), dtype=np.float32
+            )
+            grown[:length] = to_return[:length]
+            to_return = grown
+        _to_float(samples, out=to_return[length : length + len(samples)])
+        length += len(samples)
+
+    to_return.resize(length, refcheck=False)
     return to_return
 
 
+def iter_audio(
+    x: Path | str | InputContainer, chunk_size: int
+) -> Iterator[npt.NDArray[np.float32]]:
+    """decode the audio of the given media in chunks of `chunk_size` samples
+
+    Only the last chunk may be shorter.
+
+    Args:
+        x (Path | str | InputContainer): the media
+        chunk_size (int): the number of samples per chunk
+
+    Yields:
+        npt.NDArray[np.float32]: mono audio at `settings.SAMPLE_RATE`, normalized to
+            [-1, +1]
+    """
+    input_file = as_input_container(x)
+    chunk = np.empty(chunk_size, dtype=np.float32)
+    length = 0
+    for samples in _decode_audio(input_file):
+        while len(samples) > 0:
+            n = min(chunk_size - length, len(samples))
+            _to_float(samples[:n], out=chunk[length : length + n])
+            length += n
+            samples = samples[n:]
+            if length == chunk_size:
+                yield chunk
+                chunk = np.empty(chunk_size, dtype=np.float32)
+                length = 0
+    if length > 0:
+        yield chunk[:length]
+
+
 def get_duration(x: Path | str | InputContainer):
     """return the duration in seconds for the given media
 
@@ -79,84 +144,391 @@ def calculate_new_dimensions(prev, target):
     return int(round(w * factor)) // 2 * 2, int(round(h * factor)) // 2 * 2
 
 
-def reencode(
+def _add_video_stream(
+    container: OutputContainer,
+    video_stream: VideoStream,
+    video_params: VideoOptions,
+    thread_count: int = 0,
+    **options: str,
+) -> VideoStream:
+    sar = 1.0
+    if video_stream.sample_aspect_ratio:  # may be None or 0 if unknown
+        sar = float(video_stream.sample_aspect_ratio)
+    new_w, new_h = calculate_new_dimensions(
+        (video_stream.width, video_stream.height / sar),
+        (video_params.width, video_params.height),
+    )
+    output_stream = container.add_stream(
+        video_params.codec,
+        time_base=video_stream.time_base,
+        width=new_w,
+        height=new_h,
+        options=dict(
+            crf=str(video_params.crf),
+            preset=video_params.preset,
+            **options,
+        ),
+        thread_count=thread_count,  # 0 is an automatic number of threads
+        thread_type=ThreadType.AUTO,
+    )
+    assert isinstance(output_stream, VideoStream)
+    return output_stream
+
+
+class _FrameRotator:
+    """applies the rotation of the input video frames to their pixels"""
+
+    def __init__(self, video_stream: VideoStream):
+        self.video_stream = video_stream
+        self.filter_graph = None
+
+    def __call__(self, frame: VideoFrame) -> VideoFrame:
+        rotation = frame.rotation
+        if rotation < 0:
+            rotation = 360 + rotation
+        if frame.rotation != 0:
+            # it seems like it is currently not possible to write the displaymatrix side
+            # data field using pyav (see https://github.com/PyAV-Org/PyAV/discussions/1629).
+            # thus, we rotate the frames manually here.
+            if self.filter_graph is None:
+                self.filter_graph = Graph()
+                self.filter_graph.link_nodes(
+                    self.filter_graph.add_buffer(self.video_stream),
+                    self.filter_graph.add("rotate", str(rotation * pi / 180)),
+                    self.filter_graph.add("buffersink"),
+                )
+            self.filter_graph.vpush(frame)
+            frame = self.filter_graph.vpull()
+        return frame
+
+
+class _ReencodeOutput:
+    """one output container of `reencode_multi` with its audio and (optional) video stream"""
+
+    def __init__(
+        self,
+        output_path: Path | str,
+        output_params: OutputProfile,
+        audio_input_stream: AudioStream,
+        video_stream: VideoStream | None,
+    ):
+        self.container = av.open(
+            str(output_path),
+            mode="w",
+            format=output_params.container,
+            options=dict(movflags="+faststart"),
+        )
+        self.audio_stream = self.container.add_stream(
+            output_params.audio.codec,
+            audio_input_stream.rate,
+        )
+        assert isinstance(self.audio_stream, AudioStream)
+
+        self.video_stream = None
+        if video_stream is not None and output_params.video is not None:
+            self.video_stream = _add_video_stream(
+                self.container, video_stream, output_params.video
+            )
+
+    def encode_audio(self, frame: AudioFrame | None):
+        self.container.mux(self.audio_stream.encode(frame))
+
+    def encode_video(self, frame: VideoFrame | None):
+        if self.video_stream is not None:
+            self.container.mux(self.video_stream.encode(frame))
+
+    def close(self):
+        self.encode_audio(None)
+        self.encode_video(None)
+        self.container.close()
+
+
+def reencode_multi(
     input_path: Path | str | InputContainer,
-    output_path: Path | str,
-    output_params: OutputProfile,
+    outputs: list[tuple[Path | str, OutputProfile]],
     progress_callback: ProgressCallbackType | None = None,
 ):
+    """reencode the given media to multiple outputs at once
+
+    The input is demuxed and decoded only once, each decoded frame is passed to the
+    encoders of all outputs.
+
+    Args:
+        input_path (Path | str | InputContainer): the media
+        outputs (list[tuple[Path | str, OutputProfile]]): the output paths and their
+            profiles
+        progress_callback (ProgressCallbackType | None): called with the progress of
+            all outputs
+    """
     input_container = as_input_container(input_path)
     total_length = get_duration(input_container)
     assert total_length is not None
-    output_container = av.open(
-        str(output_path),
-        mode="w",
-        format=output_params.container,
-        options=dict(movflags="+faststart"),
-    )
 
     audio_input_stream = input_container.streams.audio[0]
-    audio_output_stream = output_container.add_stream(
-        output_params.audio.codec,
-        audio_input_stream.rate,
-    )
-    assert isinstance(audio_output_stream, AudioStream)
-    video_output_stream = None
-    video_filter_graph = None
-    if (
-        video_stream := get_video_stream(input_container)
-    ) and output_params.video is not None:
+    video_stream = get_video_stream(input_container)
+    if video_stream is not None and all(
+        output_params.video is None for _, output_params in outputs
+    ):
+        video_stream = None
+    if video_stream is not None:
         video_stream.thread_count = 0  # automatic number of threads
         video_stream.thread_type = ThreadType.AUTO
-        sar = 1.0
-        if video_stream.sample_aspect_ratio is not None:
-            sar = float(video_stream.sample_aspect_ratio)
-        new_w, new_h = calculate_new_dimensions(
-            (video_stream.width, video_stream.height / sar),
-            (output_params.video.width, output_params.video.height),
-        )
-        video_output_stream = output_container.add_stream(
-            output_params.video.codec,
-            time_base=video_stream.time_base,
-            width=new_w,
-            height=new_h,
-            options=dict(
-                crf=str(output_params.video.crf), preset=output_params.video.preset
-            ),
-            thread_count=0,  # automatic number of threads
-            thread_type=ThreadType.AUTO,
-        )
-        assert isinstance(video_output_stream, VideoStream)
+
+    reencode_outputs = [
+        _ReencodeOutput(output_path, output_params, audio_input_stream, video_stream)
+        for output_path, output_params in outputs
+    ]
+    rotate = _FrameRotator(video_stream) if video_stream is not None else None
 
     for packet in input_container.demux():
         if packet.stream == audio_input_stream:
             for frame in packet.decode():
                 assert isinstance(frame, AudioFrame)
-                output_container.mux(audio_output_stream.encode(frame))
+                for output in reencode_outputs:
+                    output.encode_audio(frame)
                 if frame.pts is not None and progress_callback is not None:
                     time = float(frame.pts * packet.time_base)
                     progress_callback(progress=time / total_length)
-        elif video_output_stream is not None and packet.stream == video_stream:
+        elif rotate is not None and packet.stream == video_stream:
             for frame in packet.decode():
                 assert isinstance(frame, VideoFrame)
-                rotation = frame.rotation
-                if rotation < 0:
-                    rotation = 360 + rotation
-                if frame.rotation != 0:
-                    # it seems like it is currently not possible to write the displaymatrix side
-                    # data field using pyav (see https://github.com/PyAV-Org/PyAV/discussions/1629).
-                    # thus, we rotate the frames manually here.
-                    if video_filter_graph is None:
-                        video_filter_graph = Graph()
-                        video_filter_graph.link_nodes(
-                            video_filter_graph.add_buffer(video_stream),
-                            video_filter_graph.add("rotate", str(rotation * pi / 180)),
-                            video_filter_graph.add("buffersink"),
-                        )
-                    video_filter_graph.vpush(frame)
-                    frame = video_filter_graph.vpull()
-                output_container.mux(video_output_stream.encode(frame))
-    output_container.mux(audio_output_stream.encode(None))
-    if video_output_stream is not None:
-        output_container.mux(video_output_stream.encode(None))
+                frame = rotate(frame)
+                for output in reencode_outputs:
+                    output.encode_video(frame)
+    for output in reencode_outputs:
+        output.close()
+
+
+def reencode(
+    input_path: Path | str | InputContainer,
+    output_path: Path | str,
+    output_params: OutputProfile,
+    progress_callback: ProgressCallbackType | None = None,
+):
+    reencode_multi(input_path, [(output_path, output_params)], progress_callback)
+
+
+def get_keyframe_times(x: Path | str | InputContainer) -> list[int]:
+    """return the presentation timestamps of all keyframes of the video stream
+
+    Only the packets are demuxed, nothing is decoded.
+
+    Args:
+        x (Path | str | InputContainer): the media
+
+    Returns:
+        list[int]: the timestamps in the time base of the video stream
+    """
+    input_file = as_input_container(x)
+    video_stream = get_video_stream(input_file)
+    assert video_stream is not None
+    return sorted(
+        packet.pts
+        for packet in input_file.demux(video_stream)
+        if packet.is_keyframe and packet.pts is not None
+    )
+
+
+def _choose_segment_starts(
+    keyframes: list[int], time_base: Fraction, total_length: float, segments: int
+) -> list[int]:
+    segment_length = max(
+        total_length / segments, settings.REENCODE_MIN_SEGMENT_DURATION
+    )
+    starts = [keyframes[0]]
+    for keyframe in keyframes[1:]:
+        if float((keyframe - starts[-1]) * time_base) >= segment_length:
+            starts.append(keyframe)
+    return starts
+
+
+def _reencode_video_segment(
+    input_path: str,
+    output_path: str,
+    video_params: VideoOptions,
+    start: int,
+    end: int | None,
+    progress: "Queue[tuple[int, int]]",
+    thread_count: int,
+):
+    input_container = av.open(input_path)
+    video_stream = get_video_stream(input_container)
+    assert video_stream is not None
+    video_stream.thread_count = thread_count
+    video_stream.thread_type = ThreadType.AUTO
+
+    output_container = av.open(output_path, mode="w", format="matroska")
+    # without b-frames the decoding timestamps of a segment do not reach back into the
+    # previous segment, so the segments can simply be concatenated
+    output_stream = _add_video_stream(
+        output_container, video_stream, video_params, thread_count, bf="0"
+    )
+    rotate = _FrameRotator(video_stream)
+
+    time_base = video_stream.time_base
+    assert time_base is not None
+    reported_pts = start
+    input_container.seek(start, stream=video_stream, backward=True)
+    for frame in input_container.decode(video_stream):
+        if frame.pts is None or frame.pts < start:
+            continue
+        if end is not None and frame.pts >= end:
+            break
+        output_container.mux(output_stream.encode(rotate(frame)))
+        # report about once per second of video to keep the inter-process traffic low
+        if (frame.pts - reported_pts) * time_base >= 1:
+            progress.put((start, frame.pts))
+            reported_pts = frame.pts
+    output_container.mux(output_stream.encode(None))
     output_container.close()
+
+
+def _reencode_audio_only(
+    input_path: str, output_path: str, output_params: OutputProfile
+):
+    reencode(input_path, output_path, replace(output_params, video=None))
+
+
+def _iter_packets(paths: list[Path]) -> Iterator[tuple[float, Packet]]:
+    for path in paths:
+        container = av.open(str(path))
+        for packet in container.demux(container.streams[0]):
+            if packet.dts is None:  # flush packet
+                continue
+            yield float(packet.dts * packet.time_base), packet
+        container.close()
+
+
+def _concat(
+    audio_path: Path,
+    video_segment_paths: list[Path],
+    output_path: Path | str,
+    container: str,
+):
+    audio_input = av.open(str(audio_path))
+    video_input = av.open(str(video_segment_paths[0]))
+    output_container = av.open(
+        str(output_path),
+        mode="w",
+        format=container,
+        options=dict(movflags="+faststart"),
+    )
+    output_streams = {
+        "audio": output_container.add_stream_from_template(
+            audio_input.streams.audio[0]
+        ),
+        "video": output_container.add_stream_from_template(
+            video_input.streams.video[0]
+        ),
+    }
+    video_input.close()
+    audio_input.close()
+
+    # interleave the packets of both streams by their decoding time
+    for _, packet in heapq.merge(
+        _iter_packets([audio_path]),
+        _iter_packets(video_segment_paths),
+        key=lambda x: x[0],
+    ):
+        packet.stream = output_streams[packet.stream.type]
+        output_container.mux(packet)
+    output_container.close()
+
+
+def reencode_segmented(
+    input_path: Path | str,
+    output_path: Path | str,
+    output_params: OutputProfile,
+    progress_callback: ProgressCallbackType | None = None,
+    segments: int | None = None,
+):
+    """reencode a video in parallel
+
+    The video stream is split at keyframes into up to `segments` time ranges, which are
+    encoded in separate processes and then concatenated without reencoding. The audio
+    stream is encoded in its own process as a whole.
+
+    Args:
+        input_path (Path | str): the media
+        output_path (Path | str): the output path
+        output_params (OutputProfile): the output profile, must contain video options
+        progress_callback (ProgressCallbackType | None): called with the progress of
+            all segments
+        segments (int | None): the maximum number of segments, defaults to
+            `settings.REENCODE_SEGMENTS`
+    """
+    assert output_params.video is not None
+    if segments is None:
+        segments = settings.REENCODE_SEGMENTS
+    input_container = as_input_container(input_path)
+    total_length = get_duration(input_container)
+    video_stream = get_video_stream(input_container)
+    assert video_stream is not None
+    time_base = video_stream.time_base
+    assert time_base is not None
+    starts = _choose_segment_starts(
+        get_keyframe_times(input_container), time_base, total_length, segments
+    )
+    input_container.close()
+    if len(starts) < 2:
+        return reencode(input_path, output_path, output_params, progress_callback)
+
+    ends: list[int | None] = [*starts[1:], None]
+    segment_lengths = {
+        start: (
+            float((end - start) * time_base)
+            if end is not None
+            else total_length - float((start - starts[0]) * time_base)
+        )
+        for start, end in zip(starts, ends)
+    }
+    tmpdir = Path(tempfile.mkdtemp(dir=Path(output_path).parent))
+    segment_paths = [tmpdir / f"segment_{i}.mkv" for i in range(len(starts))]
+    audio_path = tmpdir / f"audio.{output_params.container}"
+    # the segment processes share the cpu cores instead of each using all of them
+    cpu_count = os.cpu_count() or 1
+    max_workers = min(len(starts) + 1, cpu_count)
+    thread_count = max(cpu_count // max_workers, 1)
+    mp_context = multiprocessing.get_context("spawn")
+    try:
+        with mp_context.Manager() as manager, ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=mp_context
+        ) as executor:
+            progress = manager.Queue()
+            audio_future = executor.submit(
+                _reencode_audio_only, str(input_path), str(audio_path), output_params
+            )
+            segment_futures = {
+                executor.submit(
+                    _reencode_video_segment,
+                    str(input_path),
+                    str(segment_path),
+                    output_params.video,
+                    start,
+                    end,
+                    progress,
+                    thread_count,
+                ): start
+                for segment_path, start, end in zip(segment_paths, starts, ends)
+            }
+
+            encoded = {start: 0.0 for start in starts}
+            pending = {audio_future, *segment_futures}
+            while pending:
+                done, pending = wait(pending, timeout=0.5)
+                while not progress.empty():
+                    start, pts = progress.get_nowait()
+                    encoded[start] = float((pts - start) * time_base)
+                for future in done:
+                    future.result()
+                    if future in segment_futures:
+                        start = segment_futures[future]
+                        encoded[start] = segment_lengths[start]
+                if progress_callback is not None:
+                    progress_callback(
+                        progress=min(sum(encoded.values()) / total_length, 1.0)
+                    )
+
+        _concat(audio_path, segment_paths, output_path, output_params.container)
+    finally:
+        shutil.rmtree(tmpdir)
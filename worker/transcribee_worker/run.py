@@ -5,8 +5,10 @@ import asyncio
 import logging
 import os
 import signal
+import time
 import traceback
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Process
 from pathlib import Path
 from sys import platform
@@ -20,6 +22,32 @@ logging.basicConfig(level=logging.INFO)
 
 settings.setup_env_vars()
 
+TASK_TYPE_NAMES = {
+    "identify": TaskType.IDENTIFY_SPEAKERS,
+    "transcribe": TaskType.TRANSCRIBE,
+    "reencode": TaskType.REENCODE,
+    "export": TaskType.EXPORT,
+}
+
+# blocking calls a slot may run at the same time: the work of its task, keepalives,
+# claiming and, while prefetching, the claim, keepalives and audio download of the
+# next task
+EXECUTOR_THREADS_PER_SLOT = 6
+# seconds to wait after a claim without work that was not held by the backend
+CLAIM_BACKOFF = 5
+
+
+def parse_slots(value: str) -> dict[TaskType, int]:
+    slots = {}
+    for item in value.split(","):
+        name, _, count = item.partition("=")
+        if name.strip() not in TASK_TYPE_NAMES or not count.strip().isdigit():
+            raise argparse.ArgumentTypeError(
+                f"invalid slot specification '{item}', expected <task type>=<count>"
+            )
+        slots[TASK_TYPE_NAMES[name.strip()]] = int(count)
+    return slots
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -47,6 +75,38 @@ def main():
         "--task-types",
         help="Task types to run [identify,transcribe,reencode,export]",
     )
+    parser.add_argument(
+        "--claim-wait",
+        help=(
+            "seconds the backend may hold a claim request until a task is ready "
+            "(long polling), 0 polls every 5 seconds instead"
+        ),
+        type=float,
+        default=30,
+    )
+    parser.add_argument(
+        "--slots",
+        help=(
+            "number of tasks of a type to run concurrently, e.g. "
+            "transcribe=1,reencode=2,export=8. Task types without slots share a "
+            "single slot"
+        ),
+        type=parse_slots,
+        default={},
+    )
+    parser.add_argument(
+        "--prefetch",
+        help=(
+            "claim the next task when the current one is almost done and download "
+            "and decode its audio in the background (requires the audio cache)"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--preload-models",
+        help="load the models needed by the task types on startup instead of lazily",
+        action="store_true",
+    )
     args = parser.parse_args()
 
     if args.websocket_base_url is None:
@@ -162,24 +222,66 @@ async def run(args):
         f"Running worker with task types: {', '.join([t.name for t in task_types])}"
     )
 
+    if args.preload_models and TaskType.IDENTIFY_SPEAKERS in task_types:
+        from transcribee_worker.identify_speakers import get_classifier  # noqa
+
+        await loop.run_in_executor(None, get_classifier)
+
     if args.token_file:
         token = Path(args.token_file).read_text()
     else:
         token = args.token
 
-    worker = Worker(
-        base_url=f"{args.coordinator}/api/v1/tasks",
-        websocket_base_url=args.websocket_base_url,
-        token=token,
-        task_types=task_types,
+    def create_worker(task_types: list[TaskType]):
+        return Worker(
+            base_url=f"{args.coordinator}/api/v1/tasks",
+            websocket_base_url=args.websocket_base_url,
+            token=token,
+            task_types=task_types,
+            claim_wait=args.claim_wait,
+            prefetch=args.prefetch and not args.run_once_and_dont_complete,
+        )
+
+    # every slot is a separate worker, which claims and runs one task at a time
+    workers = [
+        create_worker([task_type])
+        for task_type, count in args.slots.items()
+        if task_type in task_types
+        for _ in range(count)
+    ]
+    shared_task_types = [t for t in task_types if t not in args.slots]
+    if shared_task_types:
+        workers.append(create_worker(shared_task_types))
+
+    # the blocking calls of all slots run in the default executor. It is sized for the
+    # slots, so that held claims and the work of some slots can't starve the keepalives
+    # of others
+    loop.set_default_executor(
+        ThreadPoolExecutor(
+            max_workers=EXECUTOR_THREADS_PER_SLOT * max(len(workers), 1),
+            thread_name_prefix="transcribee-worker",
+        )
+    )
+
+    await asyncio.gather(
+        *(run_worker(worker, args, finish_event) for worker in workers)
     )
-    while not finish_event.is_set():
+
+
+async def run_worker(worker, args, finish_event: asyncio.Event):
+    # a prefetched task is already claimed, so it is run even when shutting down
+    while not finish_event.is_set() or worker.has_prefetched_task:
         try:
+            started = time.monotonic()
             no_work = await worker.run_task(
                 mark_completed=not args.run_once_and_dont_complete
             )
-            if no_work:
-                await wait_for_event(finish_event, timeout=5)
+            # when long polling, the backend already waited for a task to become ready.
+            # Backends that shorten or ignore the wait return early, so we back off to
+            # not poll them in a loop
+            held = time.monotonic() - started
+            if no_work and (not args.claim_wait or held < args.claim_wait / 2):
+                await wait_for_event(finish_event, timeout=CLAIM_BACKOFF)
             elif args.run_once_and_dont_complete:
                 break
         except requests.exceptions.ConnectionError:
@@ -52,6 +52,46 @@ async def async_task(generator, *args, **kwargs):
         task.cancel()
 
 
+async def abatch(iterable, max_size: int, max_delay: float):
+    """
+    Collects the items of `iterable` into lists of at most `max_size` items. A list is
+    yielded at the latest `max_delay` seconds after its first item arrived, even if no
+    further items follow.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = aiter(iterable)
+    next_item = None
+    batch = []
+    deadline = None
+    try:
+        while True:
+            if next_item is None:
+                next_item = asyncio.ensure_future(anext(iterator))
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait({next_item}, timeout=timeout)
+            if done:
+                try:
+                    item = next_item.result()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    next_item = None
+                batch.append(item)
+                if deadline is None:
+                    deadline = loop.time() + max_delay
+
+            if len(batch) >= max_size or (batch and loop.time() >= deadline):
+                yield batch
+                batch = []
+                deadline = None
+    finally:
+        if next_item is not None:
+            next_item.cancel()
+
+    if batch:
+        yield batch
+
+
 async def aenumerate(iterable, start=0):
     n = start
     async for elem in iterable:
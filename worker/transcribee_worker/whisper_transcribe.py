@@ -1,11 +1,19 @@
+import itertools
 import logging
+import os
 import re
-from typing import TYPE_CHECKING, Iterator, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 
 import decent_whisper
+import faster_whisper
+from faster_whisper.transcribe import Word
+from faster_whisper.vad import get_speech_timestamps
 from numpy.typing import NDArray
 from transcribee_proto.document import Atom, Paragraph
 from transcribee_worker.config import settings
+from transcribee_worker.model_cache import ModelCache
 from transcribee_worker.types import ProgressCallbackType
 from transcribee_worker.util import SubmissionQueue, async_task
 
@@ -27,6 +35,13 @@ DONT_COMBINE_RES = [
     re.compile(r"^\*[^\s]*\*$"),  # *Applause*
 ]
 
+model_cache: ModelCache[Tuple[str, str, int], faster_whisper.WhisperModel] = ModelCache(
+    max_bytes=settings.WHISPER_MODEL_CACHE_SIZE
+)
+# model id -> directory of the downloaded model, so that the model is only resolved
+# once per process
+model_paths: dict[str, Path] = {}
+
 
 def move_space_to_prev_token(
     iter: Iterator[Paragraph],
@@ -62,7 +77,7 @@ def _para_move_space_to_prev_token(paragraph: Paragraph):
 
 
 def whisper_segment_to_transcribee_segment(
-    iter: Iterator[List[decent_whisper.Word]], lang: str, start_offset: float
+    iter: Iterator[List[Word]], lang: str, start_offset: float
 ) -> Iterator[Paragraph]:
     for words in iter:
         assert words is not None
@@ -85,22 +100,41 @@ def whisper_segment_to_transcribee_segment(
         )
 
 
+def _sentence_breaks(iterator: "BreakIterator", text: str, start: int) -> set[int]:
+    """
+    Returns the sentence breaks in `text` at or after `start`, excluding the end of the
+    text.
+    """
+    iterator.setText(text)
+    breaks = [iterator.following(start - 1)] if start > 0 else []
+    if breaks == [BreakIterator.DONE]:
+        return set()
+    breaks.extend(iterator)
+    return set(breaks[:-1])  # The last break is the end of the text
+
+
 def strict_sentence_paragraphs(
     iter: Iterator[Paragraph],
 ) -> Iterator[Paragraph]:
+    # creating a break iterator loads the sentence rules of the locale, so we reuse
+    # one per language
+    break_iterators: dict[str, BreakIterator] = {}
     acc_paragraph = None
+    acc_text = ""
     acc_used_paras = []
     for paragraph in iter:
         if acc_paragraph is not None and len(acc_paragraph.children) > 161:
             # it seems like whisper is on some path that does not involve sentence breaks
             # as a workaround we just emit the raw whisper bars
-            yield from acc_used_paras
+            for lang, speaker, children in acc_used_paras:
+                yield Paragraph(lang=lang, speaker=speaker, children=children)
             acc_paragraph = None
 
         if acc_paragraph is None:
             acc_paragraph = Paragraph(
                 lang=paragraph.lang, speaker=paragraph.speaker, children=[]
             )
+            acc_text = ""
             acc_used_paras = []
         elif (
             acc_paragraph.lang != paragraph.lang
@@ -111,65 +145,75 @@ def strict_sentence_paragraphs(
             acc_paragraph = Paragraph(
                 lang=paragraph.lang, speaker=paragraph.speaker, children=[]
             )
+            acc_text = ""
             acc_used_paras = []
 
-        if any(regex.search(paragraph.text()) for regex in DONT_COMBINE_RES):
+        paragraph_text = paragraph.text()
+        if any(regex.search(paragraph_text) for regex in DONT_COMBINE_RES):
             if acc_paragraph.children:
                 yield acc_paragraph
             acc_paragraph = None
             yield paragraph
             continue
 
-        locale = Locale(paragraph.lang)
-        sentence_iter = BreakIterator.createSentenceInstance(locale)
-        sentence_iter.setText(acc_paragraph.text() + paragraph.text())
-        breaks = list(sentence_iter)[:-1]  # The last break is the end of the text
-        offset = 0
-        if offset + len(acc_paragraph.text()) in breaks:
+        if paragraph.lang not in break_iterators:
+            break_iterators[paragraph.lang] = BreakIterator.createSentenceInstance(
+                Locale(paragraph.lang)
+            )
+        # only breaks after the accumulated text are of interest, the text before
+        # just provides the context
+        breaks = _sentence_breaks(
+            break_iterators[paragraph.lang], acc_text + paragraph_text, len(acc_text)
+        )
+        # position of the end of `acc_paragraph` in the text passed to the iterator
+        position = len(acc_text)
+        if position in breaks:
             yield acc_paragraph
-            offset += len(acc_paragraph.text())
             acc_paragraph = Paragraph(
                 lang=paragraph.lang, speaker=paragraph.speaker, children=[]
             )
+            acc_text = ""
             acc_used_paras = []
         acc_yield_offset = 0
         for i, atom in enumerate(paragraph.children):
             acc_paragraph.children.append(atom)
-            text = acc_paragraph.text()
-            if offset + len(text) in breaks and not any(
-                regex.search(text) for regex in DONT_SPLIT_HERE_RES
+            acc_text += atom.text
+            position += len(atom.text)
+            if position in breaks and not any(
+                regex.search(acc_text) for regex in DONT_SPLIT_HERE_RES
             ):
                 yield acc_paragraph
-                offset += len(acc_paragraph.text())
                 acc_paragraph = Paragraph(
                     lang=paragraph.lang, speaker=paragraph.speaker, children=[]
                 )
+                acc_text = ""
                 acc_yield_offset = i
+        # the raw whisper bars are only turned into paragraphs if they are needed
         acc_used_paras.append(
-            Paragraph(
-                lang=paragraph.lang,
-                speaker=paragraph.speaker,
-                children=paragraph.children[acc_yield_offset:],
+            (
+                paragraph.lang,
+                paragraph.speaker,
+                paragraph.children[acc_yield_offset:],
             )
         )
     if acc_paragraph is not None and acc_paragraph.children:
         yield acc_paragraph
 
 
-def transcribe_clean(
-    queue: SubmissionQueue,
-    data: NDArray,
-    sr: int,
-    start_offset: float,
+def choose_model(model_name: str, lang_code: Optional[str]) -> str:
+    # prefer the english-only variant of a model if there is one
+    if lang_code == "en" and f"{model_name}.en" in faster_whisper.available_models():
+        return f"{model_name}.en"
+    if model_name in faster_whisper.available_models():
+        return model_name
+    raise ValueError(f"no suitable model found (size={model_name}, lang={lang_code})")
+
+
+def ensure_model_downloaded(
     model_name: str,
+    lang_code: Optional[str],
     progress_callback: ProgressCallbackType | None,
-    lang_code: Optional[str] = "en",
 ):
-    chain = (
-        move_space_to_prev_token,
-        strict_sentence_paragraphs,
-    )
-
     # hardcode faster-whisper for now, because mlx whisper
     # does not implement beam-search and QOR is very bad
     backend = decent_whisper.get_backend("faster")
@@ -204,13 +248,203 @@ def transcribe_clean(
         decent_whisper.model.download_model(model, progress_callback_download)
         logging.info("Model downloaded")
 
-    paragraphs, transcription_info = backend.transcribe(
-        data, model=model, language=lang_code
+
+def get_model_path(
+    model_name: str,
+    lang_code: Optional[str],
+    progress_callback: ProgressCallbackType | None = None,
+) -> Path:
+    ensure_model_downloaded(model_name, lang_code, progress_callback)
+    # the model is loaded from the files decent_whisper downloaded to MODELS_DIR
+    model_path = faster_whisper.download_model(
+        choose_model(model_name, lang_code), cache_dir=str(settings.MODELS_DIR)
+    )
+    return Path(model_path)
+
+
+def get_model_size(model_path: Path) -> int:
+    return sum(f.stat().st_size for f in model_path.glob("*") if f.is_file())
+
+
+def load_model(
+    model_path: Path,
+    compute_type: str,
+    num_workers: int = 1,
+    progress_callback: ProgressCallbackType | None = None,
+) -> Tuple[faster_whisper.WhisperModel, int]:
+    if progress_callback is not None:
+        progress_callback(progress=0.0, step="loading_model")
+
+    # parallel workers share the cpu cores instead of each using all of them
+    cpu_threads = max((os.cpu_count() or 1) // num_workers, 1) if num_workers > 1 else 0
+    model = faster_whisper.WhisperModel(
+        str(model_path),
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=num_workers,
+    )
+    # CTranslate2 keeps a replica of the model for every worker
+    return model, get_model_size(model_path) * num_workers
+
+
+def get_model(
+    model_name: str,
+    lang_code: Optional[str],
+    progress_callback: ProgressCallbackType | None,
+    num_workers: Optional[int] = None,
+) -> Tuple[faster_whisper.WhisperModel, int]:
+    """
+    Returns the loaded whisper model for the given size and language, loading (and
+    if necessary downloading) it on the first use.
+
+    Also returns `num_workers`, the number of threads that can transcribe with the
+    model at the same time. If it is not given, `get_transcribe_workers` picks it.
+    """
+    model_id = choose_model(model_name, lang_code)
+    compute_type = settings.WHISPER_COMPUTE_TYPE
+    model_path = model_paths.get(model_id)
+    if model_path is None:
+        model_path = get_model_path(model_name, lang_code, progress_callback)
+        model_paths[model_id] = model_path
+    if num_workers is None:
+        num_workers = get_transcribe_workers(get_model_size(model_path))
+
+    def load():
+        return load_model(model_path, compute_type, num_workers, progress_callback)
+
+    return model_cache.get((model_id, compute_type, num_workers), load), num_workers
+
+
+def get_transcribe_workers(model_size: int) -> int:
+    """
+    Returns the configured number of transcribe workers. By default, there is one
+    worker per cpu, but only as many as the model replicas of size `model_size` that
+    fit into `WHISPER_MODEL_CACHE_SIZE`.
+    """
+    if settings.TRANSCRIBE_WORKERS:
+        return settings.TRANSCRIBE_WORKERS
+    num_workers = os.cpu_count() or 1
+    if settings.WHISPER_MODEL_CACHE_SIZE > 0 and model_size > 0:
+        num_workers = min(
+            num_workers, max(settings.WHISPER_MODEL_CACHE_SIZE // model_size, 1)
+        )
+    return num_workers
+
+
+def choose_chunks(
+    speech: List[dict], total_samples: int, max_chunk_samples: int
+) -> List[Tuple[int, int]]:
+    """
+    Splits the audio into chunks of at most `max_chunk_samples`, cutting in the middle
+    of the silence between two speech segments wherever possible.
+
+    `speech` are the speech segments as returned by `get_speech_timestamps`. Returns
+    the start and end sample of each chunk.
+    """
+    cuts = [
+        (prev["end"] + next["start"]) // 2
+        for prev, next in itertools.pairwise(speech)
+        if prev["end"] < next["start"]
+    ]
+    chunks = []
+    start = 0
+    while total_samples - start > max_chunk_samples:
+        candidates = [cut for cut in cuts if start < cut <= start + max_chunk_samples]
+        # without silence to cut at, we have to split speech
+        end = candidates[-1] if candidates else start + max_chunk_samples
+        chunks.append((start, end))
+        start = end
+    chunks.append((start, total_samples))
+    return chunks
+
+
+def _transcribe_chunk(
+    model: faster_whisper.WhisperModel, data: NDArray, lang_code: str
+) -> List[List[Word]]:
+    segments, _ = model.transcribe(data, language=lang_code, word_timestamps=True)
+    return [segment.words or [] for segment in segments]
+
+
+def transcribe_chunked(
+    model: faster_whisper.WhisperModel,
+    data: NDArray,
+    sr: int,
+    start_offset: float,
+    lang_code: Optional[str],
+    num_workers: int,
+) -> Tuple[Iterator[Paragraph], str]:
+    """
+    Transcribes chunks of the audio, split at silences, in parallel. The paragraphs are
+    yielded in order as soon as all previous chunks are done.
+    """
+    if lang_code is None:
+        # all chunks are transcribed in the same language, which is detected once
+        lang_code, _, _ = model.detect_language(data, vad_filter=True)
+
+    # chunks are at least as long as a whisper window, but short enough to keep all
+    # workers busy
+    max_chunk_samples = int(
+        max(
+            min(settings.TRANSCRIBE_CHUNK_DURATION * sr, len(data) / num_workers),
+            30 * sr,
+        )
+    )
+    speech = get_speech_timestamps(data, sampling_rate=sr)
+    chunks = choose_chunks(speech, len(data), max_chunk_samples)
+
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+    futures = [
+        executor.submit(_transcribe_chunk, model, data[start:end], lang_code)
+        for start, end in chunks
+    ]
+
+    def paragraphs():
+        try:
+            for (start, _), future in zip(chunks, futures):
+                yield from whisper_segment_to_transcribee_segment(
+                    iter(future.result()),
+                    lang=lang_code,
+                    start_offset=start_offset + start / sr,
+                )
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    return paragraphs(), lang_code
+
+
+def transcribe_clean(
+    queue: SubmissionQueue,
+    data: NDArray,
+    sr: int,
+    start_offset: float,
+    model_name: str,
+    progress_callback: ProgressCallbackType | None,
+    lang_code: Optional[str] = "en",
+):
+    chain = (
+        move_space_to_prev_token,
+        strict_sentence_paragraphs,
     )
 
-    seg_iter = whisper_segment_to_transcribee_segment(
-        iter(paragraphs), lang=transcription_info.language, start_offset=start_offset
+    model, num_workers = get_model(
+        model_name,
+        lang_code=lang_code,
+        progress_callback=progress_callback,
     )
+
+    if num_workers > 1:
+        seg_iter, language = transcribe_chunked(
+            model, data, sr, start_offset, lang_code, num_workers
+        )
+    else:
+        segments, transcription_info = model.transcribe(
+            data, language=lang_code, word_timestamps=True
+        )
+        paragraphs = (segment.words or [] for segment in segments)
+        language = transcription_info.language
+        seg_iter = whisper_segment_to_transcribee_segment(
+            iter(paragraphs), lang=language, start_offset=start_offset
+        )
     total_len = len(data) / sr
     for elem in chain:
         seg_iter = elem(seg_iter)
@@ -227,7 +461,7 @@ def transcribe_clean(
     if is_empty:
         v = Paragraph(
             children=[Atom(text="", start=0, end=0, conf=0, conf_ts=1)],
-            lang=transcription_info.language,
+            lang=language,
         )
         queue.submit(v)
 
@@ -4,6 +4,7 @@ import mimetypes
 import tempfile
 import time
 import traceback
+import urllib.parse
 from pathlib import Path
 from typing import Any, Optional
 from uuid import UUID
@@ -17,6 +18,7 @@ from transcribee_proto.api import (
     BaseDocumentMedia,
     ExportFormat,
     ExportTask,
+    ExportTaskParameters,
     LocalDocumentMedia,
     ReencodeTask,
     RemoteDocumentMedia,
@@ -26,23 +28,36 @@ from transcribee_proto.api import (
 )
 from transcribee_proto.api import Document as ApiDocument
 from transcribee_proto.document import Document as EditorDocument
-from transcribee_worker.api_client import ApiClient
+from transcribee_proto.webvtt.export_webvtt import generate_web_vtt
+from transcribee_proto.webvtt.webvtt_writer import SubtitleFormat
+from transcribee_worker.api_client import ApiClient, TransferProgressCallback
+from transcribee_worker.audio_cache import AudioCache
 from transcribee_worker.config import settings
 from transcribee_worker.identify_speakers import identify_speakers
 from transcribee_worker.reencode import (
     get_duration,
     get_video_stream,
     load_audio,
-    reencode,
+    reencode_multi,
+    reencode_segmented,
 )
 from transcribee_worker.types import ProgressCallbackType
-from transcribee_worker.util import alist, async_task
-from transcribee_worker.webvtt.export_webvtt import generate_web_vtt
-from transcribee_worker.webvtt.webvtt_writer import SubtitleFormat
+from transcribee_worker.util import abatch, alist, async_task
 from transcribee_worker.whisper_transcribe import (
     transcribe_clean_async,
 )
 
+# progress steps of the actual work of tasks that load the document audio. The next
+# task is only prefetched once one of them reaches `settings.PREFETCH_PROGRESS`, other
+# tasks finish too quickly for prefetching to save time
+PREFETCH_STEPS = {
+    f"{TaskType.TRANSCRIBE}:transcribe",
+    f"{TaskType.IDENTIFY_SPEAKERS}:generating speaker embeddings",
+    f"{TaskType.IDENTIFY_SPEAKERS}:clustering speaker embeddings",
+}
+# seconds between two checks of the progress of a running task
+PROGRESS_CHECK_INTERVAL = 1.0
+
 
 def normalize_for_automerge(value):
     def normalize_value(k, v):
@@ -75,6 +90,51 @@ def ensure_atom_invariants(doc: EditorDocument):
         prev_atom = atom
 
 
+def transfer_progress_callback(
+    progress_callback: Optional[ProgressCallbackType], step: str, progress: float
+) -> Optional[TransferProgressCallback]:
+    """
+    Adapts the progress of a media transfer to the task progress. The transferred bytes
+    are reported at most once per second as extra data.
+    """
+    if progress_callback is None:
+        return None
+
+    last_report = 0.0
+
+    def callback(loaded: int, total: Optional[int]):
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report < 1 and loaded != total:
+            return
+        last_report = now
+        progress_callback(
+            progress=progress,
+            step=step,
+            extra_data={"transfer_loaded": loaded, "transfer_total": total},
+        )
+
+    return callback
+
+
+def render_export(document: dict, params: ExportTaskParameters) -> dict:
+    try:
+        vtt = generate_web_vtt(
+            EditorDocument.model_validate(document),
+            params.include_speaker_names,
+            params.include_word_timing,
+            params.max_line_length,
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+
+    if params.format == ExportFormat.VTT:
+        return {"result": vtt.to_string(SubtitleFormat.VTT)}
+    elif params.format == ExportFormat.SRT:
+        return {"result": vtt.to_string(SubtitleFormat.SRT)}
+    return {"result": None}
+
+
 def get_last_atom_end(doc: EditorDocument):
     for paragraph_idx in reversed(range(len(doc.children))):
         for atom_idx in reversed(range(len(doc.children[paragraph_idx].children))):
@@ -98,9 +158,20 @@ class Worker:
         websocket_base_url: str,
         token: str,
         task_types: Optional[list[TaskType]] = None,
+        claim_wait: float = 0,
+        prefetch: bool = False,
     ):
         self.api_client = ApiClient(base_url, websocket_base_url, token)
+        self.audio_cache = AudioCache(
+            settings.AUDIO_CACHE_DIR, max_bytes=settings.AUDIO_CACHE_SIZE
+        )
         self.tmpdir = None
+        # number of seconds the backend may hold a claim request until a task is ready
+        self.claim_wait = claim_wait
+        # the next task is claimed while the current one finishes, its audio is
+        # prefetched into the audio cache
+        self.prefetch = prefetch and self.audio_cache.max_bytes > 0
+        self._prefetched_task: Optional[asyncio.Task] = None
         if task_types is not None:
             self.task_types = task_types
         else:
@@ -111,10 +182,21 @@ class Worker:
                 TaskType.EXPORT,
             ]
 
-    def claim_task(self) -> Optional[AssignedTask]:
+    def claim_task(
+        self,
+        task_types: Optional[list[TaskType]] = None,
+        wait: Optional[float] = None,
+    ) -> Optional[AssignedTask]:
         logging.debug("Asking backend for new task")
+        if task_types is None:
+            task_types = self.task_types
+        if wait is None:
+            wait = self.claim_wait
         req = self.api_client.post(
-            "tasks/claim_unassigned_task/", params={"task_type": self.task_types}
+            "tasks/claim_unassigned_task/",
+            params={"task_type": task_types, "wait": wait},
+            # the backend holds the request for up to `wait` seconds
+            timeout=(settings.API_CONNECT_TIMEOUT, wait + settings.API_READ_TIMEOUT),
         )
 
         return TypeAdapter(Optional[AssignedTask]).validate_json(req.text)  # type: ignore
@@ -124,13 +206,21 @@ class Worker:
             raise ValueError("`tmpdir` must be set")
         return self.tmpdir / filename
 
-    def download_media(self, media_file: RemoteDocumentMedia) -> Path:
+    def download_media(
+        self,
+        media_file: RemoteDocumentMedia,
+        progress_callback: Optional[ProgressCallbackType] = None,
+    ) -> Path:
         logging.debug(f"loading audio. {media_file=}")
-        response = self.api_client.get(media_file.url)
         extension = mimetypes.guess_extension(media_file.content_type)
         path = self._get_tmpfile(f"doc_audio{extension}")
-        with open(path, "wb") as f:
-            f.write(response.content)
+        self.api_client.download(
+            media_file.url,
+            path,
+            transfer_progress_callback(
+                progress_callback, step="downloading_media", progress=0.0
+            ),
+        )
         return path
 
     def find_document_audio_media_file(
@@ -146,23 +236,59 @@ class Worker:
                 break
         return media_file
 
-    def get_document_audio_path(self, document: ApiDocument) -> Optional[Path]:
-        mf = self.find_document_audio_media_file(document)
-        if not mf:
-            return
+    def get_media_path(
+        self,
+        mf: BaseDocumentMedia,
+        progress_callback: Optional[ProgressCallbackType] = None,
+    ) -> Optional[Path]:
         if settings.WORKER_TYPE == "web" and isinstance(mf, RemoteDocumentMedia):
-            return self.download_media(mf)
+            return self.download_media(mf, progress_callback)
         elif settings.WORKER_TYPE == "desktop" and isinstance(mf, LocalDocumentMedia):
             return Path(mf.path) if mf.path else None
 
-    def load_document_audio(self, document: ApiDocument) -> npt.NDArray:
-        document_audio = self.get_document_audio_path(document)
+    def get_document_audio_path(
+        self,
+        document: ApiDocument,
+        progress_callback: Optional[ProgressCallbackType] = None,
+    ) -> Optional[Path]:
+        mf = self.find_document_audio_media_file(document)
+        if not mf:
+            return
+        return self.get_media_path(mf, progress_callback)
+
+    def get_audio_cache_key(self, mf: BaseDocumentMedia) -> Optional[str]:
+        if isinstance(mf, RemoteDocumentMedia):
+            # media files are stored under unique names and never modified, so the url
+            # (without the expiring signature) identifies the content
+            url = urllib.parse.urlsplit(mf.url).path
+            return f"{url}@{settings.SAMPLE_RATE}"
+        elif isinstance(mf, LocalDocumentMedia) and mf.path:
+            stat = Path(mf.path).stat()
+            return f"{mf.path}:{stat.st_mtime_ns}:{stat.st_size}@{settings.SAMPLE_RATE}"
+
+    def load_document_audio(
+        self,
+        document: ApiDocument,
+        progress_callback: Optional[ProgressCallbackType] = None,
+    ) -> npt.NDArray:
+        mf = self.find_document_audio_media_file(document)
+        cache_key = self.get_audio_cache_key(mf) if mf else None
+        if cache_key is not None:
+            audio = self.audio_cache.get(cache_key)
+            if audio is not None:
+                return audio
+
+        document_audio = self.get_media_path(mf, progress_callback) if mf else None
         if document_audio is None:
             raise ValueError(f"Document {document} has no audio attached.")
-        return load_audio(document_audio)
-
-    def keepalive(self, task_id: UUID) -> bool:
-        body = self._result_data["progress"][-1]
+        audio = load_audio(document_audio)
+        if cache_key is not None:
+            self.audio_cache.put(cache_key, audio)
+        return audio
+
+    def keepalive(self, task_id: UUID, body: Optional[dict] = None) -> bool:
+        if body is None:
+            body = self._result_data["progress"][-1]
         logging.debug(f"Sending keepalive for {task_id=}: {body=}")
         try:
             self.api_client.post(f"tasks/{task_id}/keepalive/", json=body)
@@ -175,6 +301,119 @@ class Worker:
                 logging.error(f"keepalive failed: {e}")
         return True
 
+    async def keep_alive_while_running(self, task_id: UUID, task: asyncio.Task):
+        """
+        Sends keepalives until `task` is done. Progress changes are sent at most once
+        per second, otherwise a keepalive is sent every `settings.WORKER_TIMEOUT / 4`
+        seconds. Cancels `task` if the backend no longer knows it.
+        """
+        loop = asyncio.get_running_loop()
+        keepalive_interval = max(settings.WORKER_TIMEOUT / 4, 1)
+        sent_progress = None
+        last_sent = 0.0
+        while not task.done():
+            progress = self._result_data["progress"][-1]
+            if (
+                self.prefetch
+                and self._prefetched_task is None
+                and progress["step"] in PREFETCH_STEPS
+                and (progress["progress"] or 0) >= settings.PREFETCH_PROGRESS
+            ):
+                self._prefetched_task = asyncio.create_task(self.prefetch_next_task())
+            now = time.monotonic()
+            if progress is not sent_progress or now - last_sent >= keepalive_interval:
+                sent_progress = progress
+                last_sent = now
+                # keepalive() blocks on the request, which must not stall the
+                # document sync running on the event loop
+                should_continue = await loop.run_in_executor(
+                    None, self.keepalive, task_id
+                )
+                if not should_continue:
+                    task.cancel()
+                    logging.info("canceling task!")
+            await asyncio.wait({task}, timeout=PROGRESS_CHECK_INTERVAL)
+
+    @property
+    def has_prefetched_task(self) -> bool:
+        return self._prefetched_task is not None
+
+    async def prefetch_next_task(self) -> Optional[tuple[AssignedTask, asyncio.Task]]:
+        """
+        Claims the next task without waiting and loads its audio into the audio cache.
+
+        Only tasks that load the document audio are prefetched, and at most one at a
+        time, so that other workers are not starved. Returns the task together with
+        the keepalive loop that holds the claim until the task is run.
+        """
+        task_types = [
+            t
+            for t in self.task_types
+            if t in [TaskType.TRANSCRIBE, TaskType.IDENTIFY_SPEAKERS]
+        ]
+        if not task_types:
+            return None
+
+        loop = asyncio.get_running_loop()
+        try:
+            task = await loop.run_in_executor(None, self.claim_task, task_types, 0)
+        except Exception as exc:
+            logging.warning("Claiming the next task failed", exc_info=exc)
+            return None
+        if task is None:
+            return None
+
+        logging.info(f"Prefetching media of next task: {task.id}")
+        keepalive = asyncio.create_task(self.keep_prefetched_task_alive(task))
+        try:
+            await loop.run_in_executor(
+                None, self.prefetch_document_audio, task.document
+            )
+        except Exception as exc:
+            # the task loads its audio itself once it runs
+            logging.warning("Prefetching media failed", exc_info=exc)
+        return task, keepalive
+
+    def prefetch_document_audio(self, document: ApiDocument):
+        mf = self.find_document_audio_media_file(document)
+        cache_key = self.get_audio_cache_key(mf) if mf else None
+        if cache_key is None or self.audio_cache.get(cache_key) is not None:
+            return
+
+        # the current task owns `self.tmpdir`
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if isinstance(mf, RemoteDocumentMedia) and settings.WORKER_TYPE == "web":
+                path = Path(tmpdir) / "prefetched_audio"
+                self.api_client.download(mf.url, path)
+            elif isinstance(mf, LocalDocumentMedia) and mf.path:
+                path = Path(mf.path)
+            else:
+                return
+            self.audio_cache.put(cache_key, load_audio(path))
+
+    async def keep_prefetched_task_alive(self, task: AssignedTask):
+        loop = asyncio.get_running_loop()
+        body = {"step": f"{task.task_type}:prefetch", "progress": 0.0}
+        while await loop.run_in_executor(None, self.keepalive, task.id, body):
+            await asyncio.sleep(max(settings.WORKER_TIMEOUT / 4, 1))
+
+    async def _get_next_task(self) -> Optional[AssignedTask]:
+        loop = asyncio.get_running_loop()
+        if self._prefetched_task is not None:
+            try:
+                prefetched = await self._prefetched_task
+            finally:
+                self._prefetched_task = None
+            if prefetched is not None:
+                task, keepalive = prefetched
+                if not keepalive.done():
+                    keepalive.cancel()
+                    return task
+                logging.info(f"Prefetched task {task.id} is gone, claiming a new one")
+
+        # claiming might block until a task is ready, so don't block the event loop
+        return await loop.run_in_executor(None, self.claim_task)
+
     async def perform_task(self, task: AssignedTask):
         logging.info(f"Running task: {task=}")
 
@@ -198,7 +437,10 @@ class Worker:
     async def transcribe(
         self, task: TranscribeTask, progress_callback: ProgressCallbackType
     ):
-        audio = self.load_document_audio(task.document)
+        # loading might download the media, which must not block other tasks
+        audio = await asyncio.get_running_loop().run_in_executor(
+            None, self.load_document_audio, task.document, progress_callback
+        )
 
         async with self.api_client.document(task.document.id) as doc:
             async with doc.transaction("Reset Document") as d:
@@ -209,7 +451,7 @@ class Worker:
 
             audio = audio[int(start_offset * settings.SAMPLE_RATE) :]
 
-            async for paragraph in transcribe_clean_async(
+            paragraphs = transcribe_clean_async(
                 data=audio,
                 sr=settings.SAMPLE_RATE,
                 start_offset=start_offset,
@@ -220,16 +462,27 @@ class Worker:
                     else None
                 ),
                 progress_callback=progress_callback,
+            )
+            # every transaction is a separate change that is stored and broadcasted by
+            # the backend, so paragraphs are appended in batches
+            async for batch in abatch(
+                paragraphs,
+                max_size=settings.TRANSCRIBE_BATCH_SIZE,
+                max_delay=settings.TRANSCRIBE_BATCH_DELAY,
             ):
                 async with doc.transaction("Automatic Transcription") as d:
-                    p = paragraph.dict()
-                    normalize_for_automerge(p)
-                    d.children.append(p)
+                    for paragraph in batch:
+                        p = paragraph.dict()
+                        normalize_for_automerge(p)
+                        d.children.append(p)
 
     async def identify_speakers(
         self, task: SpeakerIdentificationTask, progress_callback: ProgressCallbackType
     ):
-        audio = self.load_document_audio(task.document)
+        # loading might download the media, which must not block other tasks
+        audio = await asyncio.get_running_loop().run_in_executor(
+            None, self.load_document_audio, task.document, progress_callback
+        )
         assert (
             task.task_parameters.number_of_speakers != 0
         )  # this would not make any sense
@@ -246,16 +499,21 @@ class Worker:
     async def reencode(
         self, task: ReencodeTask, progress_callback: ProgressCallbackType
     ):
-        document_audio = self.get_document_audio_path(task.document)
+        document_audio = await asyncio.get_running_loop().run_in_executor(
+            None, self.get_document_audio_path, task.document, progress_callback
+        )
         if document_audio is None:
             raise ValueError(
                 f"Document {task.document} has no audio attached. Cannot reencode."
             )
 
-        duration = get_duration(document_audio)
-        self.set_duration(task, duration)
+        loop = asyncio.get_running_loop()
+        duration = await loop.run_in_executor(None, get_duration, document_audio)
+        await loop.run_in_executor(None, self.set_duration, task, duration)
 
-        has_video = get_video_stream(document_audio) is not None
+        has_video = (
+            await loop.run_in_executor(None, get_video_stream, document_audio)
+        ) is not None
         profiles = (
             settings.REENCODE_PROFILES_DESKTOP
             if settings.WORKER_TYPE == "desktop"
@@ -267,72 +525,96 @@ class Worker:
             if (parameters.for_audio != has_video)
             or (parameters.for_video == has_video)
         }
-        n_profiles = len(applicable_profiles)
 
-        for i, (profile, parameters) in enumerate(applicable_profiles.items()):
+        output_paths = {}
+        for profile in applicable_profiles:
             if settings.WORKER_TYPE == "desktop":
                 output_path = Path(task.task_parameters["output_path"])
-                output_path = (
+                output_paths[profile] = (
                     output_path
                     / f"{task.document.id}_reencode_{profile.replace(':', '_')}"
                 )
             else:
                 assert settings.WORKER_TYPE == "web"
-                output_path = self._get_tmpfile(f"reencode_{profile.replace(':', '_')}")
+                output_paths[profile] = self._get_tmpfile(
+                    f"reencode_{profile.replace(':', '_')}"
+                )
+
+        # video profiles are encoded in parallel segments if enabled, all other
+        # profiles share a single decoding pass
+        segmented_profiles = [
+            profile
+            for profile, parameters in applicable_profiles.items()
+            if settings.REENCODE_SEGMENTS > 1 and parameters.video is not None
+        ]
+        single_pass_profiles = [
+            profile
+            for profile in applicable_profiles
+            if profile not in segmented_profiles
+        ]
+        n_passes = len(segmented_profiles) + (1 if single_pass_profiles else 0)
+
+        def pass_progress_callback(i: int):
+            return lambda progress, **kwargs: progress_callback(
+                progress=(i + progress) / n_passes,
+                step="reencode",
+                **kwargs,
+            )
 
-            def work(_):
-                return reencode(
+        def work(_):
+            for i, profile in enumerate(segmented_profiles):
+                reencode_segmented(
+                    document_audio,
+                    output_paths[profile],
+                    applicable_profiles[profile],
+                    pass_progress_callback(i),
+                )
+            if single_pass_profiles:
+                reencode_multi(
                     document_audio,
-                    output_path,
-                    parameters,
-                    lambda progress, **kwargs: progress_callback(
-                        progress=(i + progress) / n_profiles,
-                        step=f"reencode_{profile}",
-                        **kwargs,
-                    ),
+                    [
+                        (output_paths[profile], applicable_profiles[profile])
+                        for profile in single_pass_profiles
+                    ],
+                    pass_progress_callback(n_passes - 1),
                 )
 
-            await alist(aiter(async_task(work)))
+        await alist(aiter(async_task(work)))
 
+        for profile, parameters in applicable_profiles.items():
             tags = [f"profile:{profile}"]
-
             if parameters.video is not None:
                 tags.append("video")
 
-            loop = asyncio.get_running_loop()
             await loop.run_in_executor(
-                None, self.add_document_media_file, task, output_path, tags
+                None,
+                self.add_document_media_file,
+                task,
+                output_paths[profile],
+                tags,
+                transfer_progress_callback(
+                    progress_callback, step=f"uploading_{profile}", progress=1.0
+                ),
             )
 
     async def export(self, task: ExportTask, progress_callback: ProgressCallbackType):
+        loop = asyncio.get_running_loop()
         async with self.api_client.document(task.document.id) as doc:
-            params = task.task_parameters
-            res = None
-            try:
-                vtt = generate_web_vtt(
-                    EditorDocument.model_validate(automerge.dump(doc.doc)),
-                    params.include_speaker_names,
-                    params.include_word_timing,
-                    params.max_line_length,
-                )
-
-                if params.format == ExportFormat.VTT:
-                    res = vtt.to_string(SubtitleFormat.VTT)
-                elif params.format == ExportFormat.SRT:
-                    res = vtt.to_string(SubtitleFormat.SRT)
+            # the document is modified by the sync on the event loop, so it is dumped
+            # here and only the dump is rendered in the executor
+            document = automerge.dump(doc.doc)
+            res = await loop.run_in_executor(
+                None, render_export, document, task.task_parameters
+            )
 
-                res = {"result": res}
-            except ValueError as e:
-                res = {"error": str(e)}
+            logging.info(f"Uploading document export for {task.document.id=} {res=}")
+            await loop.run_in_executor(None, self.add_export_result, task, res)
 
-            if res is not None:
-                logging.info(
-                    f"Uploading document export for {task.document.id=} {res=}"
-                )
-                self.api_client.post(
-                    f"documents/{task.document.id}/add_export_result/?task_id={task.id}",
-                    json=res,
-                )
+    def add_export_result(self, task: ExportTask, result: dict):
+        self.api_client.post(
+            f"documents/{task.document.id}/add_export_result/?task_id={task.id}",
+            json=result,
+        )
 
     def set_duration(self, task: AssignedTask, duration: float):
         logging.debug(
@@ -342,13 +624,20 @@ class Worker:
             f"documents/{task.document.id}/set_duration/", json={"duration": duration}
         )
 
-    def add_document_media_file(self, task: AssignedTask, path: Path, tags: list[str]):
+    def add_document_media_file(
+        self,
+        task: AssignedTask,
+        path: Path,
+        tags: list[str],
+        progress_callback: Optional[TransferProgressCallback] = None,
+    ):
         logging.debug(f"Adding document audio for document {task.document.id=}")
         if settings.WORKER_TYPE == "web":
-            self.api_client.post(
+            self.api_client.upload(
                 f"documents/{task.document.id}/add_media_file/",
-                files={"file": open(path, "rb")},
-                data=[("tags", tag) for tag in tags],
+                path,
+                fields=[("tags", tag) for tag in tags],
+                progress_callback=progress_callback,
             )
         elif settings.WORKER_TYPE == "desktop":
             self.api_client.post(
@@ -379,17 +668,24 @@ class Worker:
         progress: Optional[float],
         extra_data: Any = None,
     ):
-        self._result_data["progress"].append(
-            {
-                "step": step,
-                "progress": progress,
-                "extra_data": extra_data,
-                "timestamp": time.time(),
-            }
-        )
+        entry = {
+            "step": step,
+            "progress": progress,
+            "extra_data": extra_data,
+            "timestamp": time.time(),
+        }
+        progress_entries = self._result_data["progress"]
+        # only keep the latest update of each step
+        if progress_entries and progress_entries[-1]["step"] == step:
+            progress_entries[-1] = entry
+        else:
+            progress_entries.append(entry)
 
     async def run_task(self, mark_completed=True):
-        task_description = self.claim_task()
+        # the requests to the backend block, so they are sent from the executor and
+        # don't stall the other slots sharing the event loop
+        loop = asyncio.get_running_loop()
+        task_description = await self._get_next_task()
         no_work = False
 
         if task_description is not None:
@@ -401,23 +697,26 @@ class Worker:
                     asyncio_task = asyncio.create_task(
                         self.perform_task(task_description)
                     )
-                    while not asyncio_task.done():
-                        should_continue = self.keepalive(task_description.id)
-                        if not should_continue:
-                            asyncio_task.cancel()
-                            logging.info("canceling task!")
-                        await asyncio.sleep(1)
+                    await self.keep_alive_while_running(
+                        task_description.id, asyncio_task
+                    )
                     task_result = await asyncio_task
                     logging.info(f"Worker returned: {task_result=}")
                     if mark_completed:
-                        self.mark_completed(
-                            task_description.id, {"result": task_result}
+                        await loop.run_in_executor(
+                            None,
+                            self.mark_completed,
+                            task_description.id,
+                            {"result": task_result},
                         )
                 self.tmpdir = None
             except Exception as exc:
                 logging.warning("Worker failed with exception", exc_info=exc)
-                self.mark_failed(
-                    task_description.id, {"exception": traceback.format_exception(exc)}
+                await loop.run_in_executor(
+                    None,
+                    self.mark_failed,
+                    task_description.id,
+                    {"exception": traceback.format_exception(exc)},
                 )
         else:
             logging.debug("Got no task, not running worker")